@@ -0,0 +1,661 @@
+import argparse
+import functools
+import json
+import logging
+import os
+import signal
+import sys
+import time
+from datetime import datetime
+
+import numpy as np
+
+import instrumentation
+from column_store import ColumnStore, lifetime, post_totals
+from exporters import COMPRESSIONS, FORMATS, RecordExporter, export_filename
+from graph_api import GRAPH_URL, GraphAPIClient, GraphAPIError, parse_time, post_id_from_url
+from incremental_sync import IncrementalSync, SyncState
+from job_control import Checkpoint, JobControl
+from metrics_cache import MetricsCache
+from report_builder import ReportBuilder
+from rollups import POSTING_GRAINS, Rollups
+from sharded_sync import SHARD_KEYS, ShardedSync
+
+# Headless analytics engine: no tkinter here, the GUI and the CLI both drive it
+logger = logging.getLogger("PPR")
+
+METRICS = ["engagement", "reach", "impressions", "clicks", "shares", "comments", "reactions"]
+
+
+def default_data_dir():
+    return os.path.join(os.path.expanduser("~"), "Facebook_Analytics_Data")
+
+
+def timestamp():
+    return datetime.now().strftime('%H:%M:%S')
+
+
+def job(name):
+    # Times every run of an engine job, and profiles it when profile_dir is set
+    def wrap(method):
+        @functools.wraps(method)
+        def run(self, *args, **kwargs):
+            with instrumentation.timed("job_seconds", job=name), instrumentation.profiled(name, self.profile_dir):
+                return method(self, *args, **kwargs)
+        return run
+    return wrap
+
+
+class AnalyticsEngine:
+    def __init__(self, data_dir=None, use_cache=True):
+        self.data_dir = data_dir or default_data_dir()
+        os.makedirs(self.data_dir, exist_ok=True)
+
+        self.session_data = {
+            "reports_generated": 0,
+            "analytics_run": 0,
+            "start_time": None,
+            "operations_completed": 0
+        }
+
+        # Facebook API configuration
+        self.fb_config = {
+            "app_id": "",
+            "app_secret": "",
+            "access_token": "",
+            "page_id": ""
+        }
+        self.connected = False
+        self.client = None
+        self.results = []
+
+        self.config = self.load_config()
+        # cProfile/tracemalloc output for every job goes here when set
+        self.profile_dir = self.config.get("profile_dir")
+
+        # Metrics already fetched are served from disk until their TTL runs out
+        self.cache = None
+        if use_cache and self.config.get("cache_enabled", True):
+            self.cache = MetricsCache(os.path.join(self.data_dir, "cache.db"),
+                                      max_bytes=int(self.config.get("cache_max_mb", 64) * 1024 * 1024),
+                                      ttl=self.config.get("cache_ttl"))
+
+        # Per-post, per-metric watermarks; the series themselves live in the column store
+        self.sync_state = SyncState(os.path.join(self.data_dir, "sync.db"))
+        self.store = ColumnStore(os.path.join(self.data_dir, "columns"))
+        # Report aggregates and top posts, updated by every write to the store
+        self.rollups = Rollups(os.path.join(self.data_dir, "rollups.db"))
+        self.rollups.attach(self.store)
+
+    def load_config(self):
+        config_path = os.path.join(self.data_dir, "config.json")
+        default = {
+            "app_id": "",
+            "access_token": "",
+            "page_id": "",
+            "processing_time": 300,
+            "auto_save": True
+        }
+        if os.path.exists(config_path):
+            try:
+                with open(config_path, 'r') as f:
+                    return json.load(f)
+            except:
+                return default
+        return default
+
+    def save_config(self):
+        config_path = os.path.join(self.data_dir, "config.json")
+        with open(config_path, 'w') as f:
+            json.dump(self.config, f, indent=4)
+
+    def connect(self, app_id, access_token, page_id, app_secret=None):
+        if not all([app_id, access_token, page_id]):
+            raise ValueError("App ID, access token and page ID are required")
+
+        if app_secret is None:
+            app_secret = self.config.get("app_secret", "")
+        client = GraphAPIClient(access_token, app_secret=app_secret,
+                                base_url=self.config.get("graph_url", GRAPH_URL))
+        try:
+            # Fails with GraphAPIError on a bad token or page id
+            page = client.validate(page_id)
+        except Exception:
+            client.close()
+            raise
+
+        if self.client:
+            self.client.close()
+        self.client = client
+        self.fb_config.update({
+            "app_id": app_id,
+            "app_secret": app_secret,
+            "access_token": access_token,
+            "page_id": page_id
+        })
+        self.connected = True
+        self.session_data["start_time"] = time.time()
+        logger.info(f"Connected to Facebook Page: {page.get('name', page_id)} ({page_id})")
+        return page
+
+    def _emit(self, log, line):
+        self.results.append(line)
+        log(line)
+
+    def _fetch_post_metrics(self, post_ids, metrics):
+        if self.cache:
+            return self.cache.fetch_post_metrics(self.client, post_ids, metrics)
+        return self.client.fetch_post_metrics(post_ids, metrics)
+
+    def _store_snapshots(self, results, exporter=None):
+        # Lifetime totals as fetched now, one column per metric
+        now = int(time.time())
+        fetched = {post_id: values for post_id, values in results.items() if not isinstance(values, GraphAPIError)}
+        for metric in METRICS:
+            rows = [(post_id, now, values[metric]) for post_id, values in fetched.items() if metric in values]
+            self.store.append_many(lifetime(metric), rows)
+            if exporter:
+                exporter.write_rows([(post_id, lifetime(metric), end_time, value) for post_id, end_time, value in rows])
+
+    def _checkpoint_max_age(self):
+        # Seconds a stopped sync can be resumed for; a long sync outlives the cache TTLs, so this is its
+        # own setting (`checkpoint_max_age` in hours)
+        return float(self.config.get("checkpoint_max_age", 24)) * 3600
+
+    def _finish_job(self):
+        # Keep the last job's output so `export` can run in a later invocation
+        with open(os.path.join(self.data_dir, "last_results.txt"), 'w') as f:
+            f.write("\n".join(self.results) + "\n")
+        self.session_data["operations_completed"] += 1
+
+    def analyze_post(self, url, log=print, progress=None, control=None):
+        return self.analyze_posts([url], log=log, progress=progress, control=control)
+
+    @job("analyze")
+    def analyze_posts(self, urls, log=print, progress=None, control=None):
+        control = control or JobControl()
+        if not self.connected:
+            raise RuntimeError("Not connected to Facebook")
+        self.results = []
+        page_id = self.fb_config["page_id"]
+        post_ids = [post_id_from_url(url, page_id) for url in urls]
+        if progress:
+            progress(0, len(post_ids), 0)
+
+        # One request for a single post, Batch API calls for several
+        results = self._fetch_post_metrics(post_ids, METRICS)
+
+        failed = 0
+        for done, post_id in enumerate(post_ids, 1):
+            if not control():
+                break
+            values = results[post_id]
+            if isinstance(values, GraphAPIError):
+                failed += 1
+                self._emit(log, f"[{timestamp()}] {post_id}: error: {values}")
+                logger.error(f"Post analysis failed for {post_id}: {values}")
+            else:
+                if len(post_ids) > 1:
+                    self._emit(log, f"[{timestamp()}] Post {post_id}")
+                for metric in METRICS:
+                    self._emit(log, f"[{timestamp()}] {metric}: {values[metric]}")
+            if progress:
+                progress(done, len(post_ids), 0)
+        self._store_snapshots(results)
+
+        completed = control() and failed < len(post_ids)
+        if completed:
+            self._emit(log, f"[{timestamp()}] Post analysis completed!")
+            self.session_data["analytics_run"] += 1
+            logger.info(f"Post analysis completed for {len(post_ids) - failed} post(s)")
+        self._finish_job()
+        return completed
+
+    @job("sync")
+    def sync_page(self, log=print, progress=None, control=None, concurrency=8, rate=20.0, history=False,
+                  exporter=None, restart=False):
+        # asyncio is only loaded for page syncs
+        from async_fetch import AsyncPageFetcher
+
+        control = control or JobControl()
+        if not self.connected:
+            raise RuntimeError("Not connected to Facebook")
+        self.results = []
+        page_id = self.fb_config["page_id"]
+        counts = {"done": 0, "failed": 0}
+        # Posts already stored by a stopped or crashed run are skipped, listing resumes at its cursor
+        checkpoint = Checkpoint(self.data_dir, "sync", page_id, max_age=self._checkpoint_max_age())
+        if restart:
+            checkpoint.clear()
+        self._emit(log, f"[{timestamp()}] Syncing all posts of page {page_id}")
+        if checkpoint.resumed:
+            self._emit(log, f"[{timestamp()}] Resuming: {len(checkpoint.completed)} posts already synced")
+
+        # Called from the event loop thread as each batch lands
+        def on_result(post_id, values):
+            counts["done"] += 1
+            if isinstance(values, GraphAPIError):
+                counts["failed"] += 1
+                self._emit(log, f"[{timestamp()}] {post_id}: error: {values}")
+            else:
+                summary = ", ".join(f"{metric}={values[metric]}" for metric in METRICS)
+                self._emit(log, f"[{timestamp()}] {post_id}: {summary}")
+            if progress:
+                progress(counts["done"], fetcher.listed - fetcher.skipped, 0)
+
+        def on_chunk(results, cursor):
+            # Stored before the checkpoint moves past them, so a crash can only repeat a batch
+            self.store.add_posts((post_id, parse_time(fetcher.created[post_id])) for post_id in results
+                                 if fetcher.created.get(post_id))
+            self._store_snapshots(results, exporter)
+            checkpoint.mark([post_id for post_id, values in results.items()
+                             if not isinstance(values, GraphAPIError)], cursor)
+
+        fetcher = AsyncPageFetcher(self.client, concurrency=concurrency, rate=rate, control=control,
+                                   fetch=self._fetch_post_metrics,
+                                   cached=self.cache.fresh_values if self.cache else None)
+        requests_before = self.client.request_count
+        start_time = time.time()
+        results = fetcher.run(page_id, METRICS, on_result=on_result, on_chunk=on_chunk,
+                              skip=checkpoint.completed, after=checkpoint.cursor)
+        elapsed = time.time() - start_time
+        completed = control()
+        if completed:
+            self._emit(log, f"[{timestamp()}] Synced {len(results) - counts['failed']} posts in {elapsed:.1f}s "
+                            f"({self.client.request_count - requests_before} requests, {fetcher.throttle_events} throttled)")
+            if self.cache:
+                self._emit(log, f"[{timestamp()}] Cache: {self.cache.hits} fresh, {self.cache.revalidated} "
+                                f"revalidated, {self.cache.misses - self.cache.revalidated} refetched")
+            self.session_data["analytics_run"] += 1
+            logger.info(f"Page sync completed: {len(results)} posts, {counts['failed']} failed")
+        else:
+            self._emit(log, f"[{timestamp()}] Sync stopped after {counts['done']} posts, run it again to resume")
+        if completed and history:
+            # Watermarks make the history pass resumable on their own
+            completed = self._sync_history(sorted(checkpoint.completed), log, control, exporter, rate)
+        if completed:
+            checkpoint.clear()
+        self._finish_job()
+        return completed
+
+    def _sync_history(self, post_ids, log, control, exporter=None, rate=20.0):
+        # Daily insights since each post's watermark; earlier history is already in sync.db
+        requests_before = self.client.request_count
+        bytes_before = self.client.bytes_received
+        on_rows = None
+        if exporter:
+            def on_rows(metric, rows):
+                exporter.write_rows([(post_id, metric, end_time, value) for post_id, end_time, value in rows])
+        from async_fetch import Pacer
+
+        # Paced and retried like the lifetime fetch; waits end early when the job is stopped
+        pacer = Pacer(self.client, rate, wait=lambda seconds: not control.wait(seconds))
+        sync = IncrementalSync(self.client, self.sync_state, self.store, METRICS, on_rows=on_rows, pacer=pacer)
+        results = sync.sync_posts(post_ids, running=control)
+        failed = sum(1 for value in results.values() if isinstance(value, GraphAPIError))
+        self._emit(log, f"[{timestamp()}] History: {sync.points_fetched} datapoints for {len(results) - failed} "
+                        f"posts ({self.client.request_count - requests_before} requests, "
+                        f"{(self.client.bytes_received - bytes_before) / 1024:.0f} KB)")
+        logger.info(f"History sync completed: {sync.points_fetched} datapoints, {failed} failed")
+        return control()
+
+    @job("sync_sharded")
+    def sync_sharded(self, log=print, progress=None, control=None, shards=None, shard_by="date", history=True,
+                     full=False, rate=20.0):
+        # Worker processes fetch shards of the page into their own segments, merged here as they finish.
+        # Used for full-history rebuilds of large pages; the metrics cache is not consulted.
+        control = control or JobControl()
+        if not self.connected:
+            raise RuntimeError("Not connected to Facebook")
+        self.results = []
+        page_id = self.fb_config["page_id"]
+        start_time = time.time()
+        posts = [(post["id"], parse_time(post["created_time"]) if post.get("created_time") else 0)
+                 for post in self.client.page_posts(page_id)]
+        sharded = ShardedSync(self.client, os.path.join(self.data_dir, "shards"), METRICS, shards=shards,
+                              shard_by=shard_by, history=history or full, full=full, rate=rate)
+        self._emit(log, f"[{timestamp()}] Syncing {len(posts)} posts of page {page_id} in up to "
+                        f"{sharded.shards} shards by {shard_by}")
+
+        totals = {"posts": 0, "failed": 0, "points": 0, "requests": 0, "rows": 0}
+        done = 0
+        for result in sharded.run(posts, self.sync_state, control):
+            totals["rows"] += sharded.merge(result, self.store, self.sync_state)
+            for key in ("posts", "failed", "points", "requests"):
+                totals[key] += result[key]
+            done += 1
+            self._emit(log, f"[{timestamp()}] Shard {result['shard']}: {result['posts']} posts, "
+                            f"{result['points']} datapoints, {result['failed']} failed in {result['seconds']:.1f}s"
+                            + (f" ({result['error']})" if result["error"] else ""))
+            if progress:
+                progress(done, min(sharded.shards, len(posts)), 0)
+
+        completed = control()
+        if completed:
+            self._emit(log, f"[{timestamp()}] Synced {totals['posts'] - totals['failed']} posts and "
+                            f"{totals['points']} datapoints in {time.time() - start_time:.1f}s "
+                            f"({totals['requests']} requests, {totals['rows']} rows merged)")
+            self.session_data["analytics_run"] += 1
+            logger.info(f"Sharded sync completed: {totals['posts']} posts, {totals['failed']} failed")
+        else:
+            self._emit(log, f"[{timestamp()}] Sharded sync stopped, {totals['rows']} rows merged")
+        self._finish_job()
+        return completed
+
+    def webhook_ingest(self, page_id=None, app_secret=None, record=None):
+        # Webhooks need no Graph API connection, only the page id and the app secret for the signatures
+        from webhooks import WebhookIngest
+
+        page_id = page_id or self.fb_config["page_id"] or self.config.get("page_id", "")
+        app_secret = app_secret or self.fb_config["app_secret"] or self.config.get("app_secret", "")
+        if not page_id:
+            raise ValueError("A page ID is required to receive webhooks")
+        return WebhookIngest(self.store, page_id, app_secret, record, rollups=self.rollups)
+
+    def serve_webhooks(self, log=print, control=None, host="127.0.0.1", port=8080, verify_token=None,
+                       page_id=None, app_secret=None, record=None):
+        # Applies Page webhook events to the stored counters until stopped; record: JSON lines file for replay
+        from webhooks import WebhookServer
+
+        control = control or JobControl()
+        verify_token = verify_token or self.config.get("webhook_verify_token", "")
+        if not verify_token:
+            raise ValueError("A verify token is required for the webhook subscription")
+        ingest = self.webhook_ingest(page_id, app_secret)
+        if not ingest.app_secret:
+            raise ValueError("app_secret is required to verify webhook signatures")
+        record_file = open(record, 'a', encoding='utf-8') if record else None
+        ingest.record = record_file
+        server = WebhookServer(ingest, verify_token, host, port).start()
+        self._emit(log, f"[{timestamp()}] Receiving webhooks for page {ingest.page_id} on {server.url}")
+        try:
+            while not control.wait(1.0):
+                pass
+        finally:
+            server.stop()
+            if record_file:
+                record_file.close()
+        self._emit(log, f"[{timestamp()}] Webhook receiver stopped, {ingest.events} events applied")
+        return True
+
+    def replay_webhooks(self, path, log=print, verify=True, page_id=None, app_secret=None):
+        ingest = self.webhook_ingest(page_id, app_secret)
+        applied = ingest.replay(path, verify=verify)
+        self._emit(log, f"[{timestamp()}] Replayed {path}: {applied} events applied")
+        return True
+
+    @job("report")
+    def generate_report(self, log=print, progress=None, control=None):
+        control = control or JobControl()
+        self.results = []
+        self.rollups.refresh(self.store)
+        builder = ReportBuilder(self._report_input)
+        if progress:
+            progress(0, len(builder.sections), 0)
+
+        start_time = time.time()
+        for done, section in enumerate(builder.build(control), 1):
+            self._emit(log, f"\n--- {section.title} ---")
+            for line in section.lines:
+                self._emit(log, line)
+            if progress:
+                progress(done, len(builder.sections), 0)
+
+        completed = control()
+        if completed:
+            self._emit(log, f"\n[{timestamp()}] Report generation completed in {time.time() - start_time:.2f}s!")
+            self.session_data["reports_generated"] += 1
+            logger.info("Report generation completed")
+        self._finish_job()
+        return completed
+
+    def _post_totals(self, metric):
+        # Latest fetched lifetime total of every post
+        return post_totals(self.store.column(lifetime(metric)), len(self.store.post_ids), cumulative=True)
+
+    def _report_input(self, name):
+        kind, _, metric = name.partition(":")
+        if name == "post_ids":
+            return list(self.store.post_ids)
+        if name == "audience":
+            return self._audience()
+        if kind == "totals":
+            return self._post_totals(metric)
+        if kind == "rollup":
+            grain, _, column = metric.partition(":")
+            if grain in POSTING_GRAINS:
+                return self.rollups.slots(column, grain)
+            return self.rollups.buckets(column, grain)
+        if kind == "top":
+            top = self.rollups.top(lifetime(metric))
+            reach = self.rollups.latest(lifetime("reach"), [post_id for post_id, _ in top])
+            return [(post_id, value, reach.get(post_id, 0.0)) for post_id, value in top]
+        raise KeyError(f"Unknown report input: {name}")
+
+    def _audience(self):
+        # Page fans by gender and age, e.g. {"F.25-34": 120}; cached like post metrics
+        if not self.connected:
+            return {}
+        page_id = self.fb_config["page_id"]
+        if self.cache:
+            entry = self.cache.lookup(page_id, ["audience"]).get("audience")
+            if entry and entry.fresh:
+                return entry.value
+        try:
+            data = self.client.insights(page_id, ["page_fans_gender_age"], period="lifetime")
+        except GraphAPIError as e:
+            logger.warning(f"Audience insights unavailable: {e}")
+            return {}
+        values = [item["values"][-1]["value"] for item in data.get("data", []) if item.get("values")]
+        audience = values[0] if values else {}
+        if self.cache:
+            self.cache.put(page_id, {"audience": audience})
+        return audience
+
+    @job("export")
+    def export_records(self, filepath=None, fmt="jsonl", compression=None, metrics=None, control=None):
+        # Every stored datapoint, streamed metric by metric in chunks; a cancelled control stops it between chunks
+        if filepath is None:
+            filepath = os.path.join(self.data_dir, export_filename(fmt, compression))
+        post_ids = np.asarray(self.store.post_ids, dtype=object)
+        with RecordExporter(filepath, fmt, compression) as exporter:
+            for metric in metrics or self.store.metrics():
+                for posts, times, values in self.store.iter_chunks(metric):
+                    if control and not control():
+                        return filepath, exporter.records
+                    # Rows written meanwhile by another process may use codes added since
+                    if len(post_ids) < len(self.store.post_ids):
+                        post_ids = np.asarray(self.store.post_ids, dtype=object)
+                    exporter.write({"post_id": post_ids[posts], "metric": [metric] * len(values),
+                                    "end_time": times, "value": values})
+        return filepath, exporter.records
+
+    def export(self, text=None, filepath=None):
+        # Save results to file
+        if text is None:
+            last_path = os.path.join(self.data_dir, "last_results.txt")
+            if self.results:
+                text = "\n".join(self.results) + "\n"
+            elif os.path.exists(last_path):
+                with open(last_path, 'r') as f:
+                    text = f.read()
+            else:
+                raise ValueError("No results to export, run analyze or report first")
+        if filepath is None:
+            filename = f"facebook_analytics_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt"
+            filepath = os.path.join(self.data_dir, filename)
+        with open(filepath, 'w') as f:
+            f.write(text)
+        logger.info(f"Data exported to {filepath}")
+        return filepath
+
+
+def add_export_options(parser):
+    parser.add_argument("--format", choices=FORMATS, default="jsonl", help="record format (default: jsonl)")
+    parser.add_argument("--compression", choices=[c for c in COMPRESSIONS if c],
+                        help="compress jsonl/csv output, or the parquet column chunks")
+
+
+def build_parser():
+    # No abbreviations: export --metric would otherwise be taken as a prefix of --metrics
+    parser = argparse.ArgumentParser(prog="post_performance_report",
+                                     description="Facebook post analytics without the GUI", allow_abbrev=False)
+    parser.add_argument("--data-dir", help="data folder (default: ~/Facebook_Analytics_Data)")
+    parser.add_argument("--app-id", help="overrides app_id from config.json")
+    parser.add_argument("--access-token", help="overrides access_token from config.json")
+    parser.add_argument("--page-id", help="overrides page_id from config.json")
+    parser.add_argument("--graph-url", help="Graph API base URL, e.g. a local graph_stub.py server")
+    parser.add_argument("--no-cache", action="store_true", help="always fetch metrics from the API")
+    parser.add_argument("--metrics", metavar="FILE", dest="metrics_file", help="write counters and timers as JSON when done ('-' for stdout)")
+    parser.add_argument("--metrics-port", type=int, metavar="PORT",
+                        help="serve Prometheus metrics on 127.0.0.1:PORT/metrics while running")
+    parser.add_argument("--profile", metavar="DIR", help="write cProfile and tracemalloc output for the job to DIR")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    analyze = sub.add_parser("analyze", help="analyze one or more posts")
+    analyze.add_argument("urls", nargs="+", metavar="url", help="Facebook post URL or post id")
+
+    sync = sub.add_parser("sync", help="fetch metrics for every post of the page concurrently")
+    sync.add_argument("--concurrency", type=int, help="batch requests in flight (default: 8)")
+    sync.add_argument("--rate", type=float, default=20.0, help="Graph API calls per second before usage backoff, split across --shards")
+    sync.add_argument("--history", action="store_true",
+                      help="also fetch daily insights newer than the stored watermarks")
+    sync.add_argument("--restart", action="store_true", help="ignore the checkpoint of a stopped sync")
+    sync.add_argument("--shards", type=int, metavar="N",
+                      help="split the page across N worker processes, then build the report")
+    sync.add_argument("--shard-by", choices=SHARD_KEYS, default="date", help="shard by post date or id range")
+    sync.add_argument("--full", action="store_true", help="with --shards: refetch the whole history (implies --history)")
+
+    sub.add_parser("report", help="generate the engagement report from the stored metrics")
+
+    webhook = sub.add_parser("webhook", help="apply Page webhook events to the stored counters instead of polling")
+    webhook.add_argument("--host", default="127.0.0.1", help="address to listen on (default: 127.0.0.1)")
+    webhook.add_argument("--port", type=int, default=8080)
+    webhook.add_argument("--verify-token", help="subscription verify token (default: webhook_verify_token from config.json)")
+    webhook.add_argument("--app-secret", help="overrides app_secret from config.json, used to check X-Hub-Signature-256")
+    webhook.add_argument("--record", metavar="FILE", help="append every verified payload to FILE for replay")
+    webhook.add_argument("--replay", metavar="FILE", help="apply recorded payloads from FILE instead of listening")
+    webhook.add_argument("--unsigned", action="store_true",
+                         help="with --replay: skip the signature check, for hand-written payloads")
+
+    sync.add_argument("--export", metavar="FILE", help="also stream the fetched records to FILE")
+    add_export_options(sync)
+
+    export = sub.add_parser("export", help="export the stored metric records")
+    export.add_argument("-o", "--output", help="output file (default: a timestamped file in the data folder)")
+    export.add_argument("--metric", action="append", dest="metrics",
+                        help="only this column, e.g. engagement or shares.lifetime (repeatable)")
+    export.add_argument("--text", action="store_true", help="export the text output of the last run instead")
+    add_export_options(export)
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.command == "sync":
+        # Sharded syncs have no checkpoint, exporter or async fetcher, and --full only applies to them
+        if args.shards:
+            unsupported = [flag for flag, value in (("--concurrency", args.concurrency), ("--restart", args.restart),
+                                                    ("--export", args.export)) if value]
+            if unsupported:
+                parser.error(f"{', '.join(unsupported)} cannot be used with --shards")
+        elif args.full:
+            parser.error("--full requires --shards")
+    if not logging.getLogger().handlers:
+        logging.basicConfig(level=logging.INFO, stream=sys.stderr,
+                            format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    if args.metrics_port:
+        instrumentation.serve(args.metrics_port)
+
+    engine = AnalyticsEngine(args.data_dir, use_cache=not args.no_cache)
+    if args.graph_url:
+        engine.config["graph_url"] = args.graph_url
+    if args.profile:
+        engine.profile_dir = args.profile
+    try:
+        return run_command(engine, args)
+    finally:
+        if args.metrics_file == "-":
+            print(json.dumps(instrumentation.registry.snapshot(), indent=4))
+        elif args.metrics_file:
+            instrumentation.write_json(args.metrics_file)
+
+
+def run_command(engine, args):
+    if args.command == "export":
+        try:
+            if args.text:
+                print(engine.export(filepath=args.output))
+            else:
+                filepath, records = engine.export_records(args.output, args.format, args.compression, args.metrics)
+                print(f"{filepath} ({records} records)")
+        except (ValueError, RuntimeError, OSError) as e:
+            print(f"Error: {e}", file=sys.stderr)
+            return 1
+        return 0
+
+    # First Ctrl-C or SIGTERM stops the job cleanly (a sync keeps its checkpoint), a second Ctrl-C aborts
+    control = JobControl()
+
+    def stop(signum, frame):
+        logger.warning("Stopping, press Ctrl-C again to abort")
+        signal.signal(signal.SIGINT, signal.default_int_handler)
+        control.cancel()
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    if args.command == "webhook":
+        try:
+            if args.replay:
+                return 0 if engine.replay_webhooks(args.replay, verify=not args.unsigned, page_id=args.page_id,
+                                                   app_secret=args.app_secret) else 1
+            return 0 if engine.serve_webhooks(control=control, host=args.host, port=args.port,
+                                              verify_token=args.verify_token, page_id=args.page_id,
+                                              app_secret=args.app_secret, record=args.record) else 1
+        except (ValueError, OSError) as e:
+            print(f"Error: {e}", file=sys.stderr)
+            return 1
+
+    try:
+        engine.connect(args.app_id or engine.config.get("app_id", ""),
+                       args.access_token or engine.config.get("access_token", ""),
+                       args.page_id or engine.config.get("page_id", ""))
+    except Exception as e:
+        # The report only reads stored data; without a connection it just lacks the audience section
+        if args.command != "report":
+            print(f"Error: Could not connect to Facebook: {e}", file=sys.stderr)
+            return 1
+        logger.warning(f"Building the report offline, could not connect to Facebook: {e}")
+
+    try:
+        if args.command == "analyze":
+            completed = engine.analyze_posts(args.urls, control=control)
+        elif args.command == "sync" and args.shards:
+            completed = engine.sync_sharded(control=control, shards=args.shards, shard_by=args.shard_by,
+                                            history=args.history, full=args.full, rate=args.rate)
+            completed = completed and engine.generate_report(control=control)
+        elif args.command == "sync":
+            options = dict(control=control, concurrency=args.concurrency or 8, rate=args.rate, history=args.history,
+                           restart=args.restart)
+            if args.export:
+                with RecordExporter(args.export, args.format, args.compression) as exporter:
+                    completed = engine.sync_page(exporter=exporter, **options)
+            else:
+                completed = engine.sync_page(**options)
+        else:
+            completed = engine.generate_report(control=control)
+    except ValueError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 2
+    except (RuntimeError, GraphAPIError, OSError) as e:
+        # OSError includes the requests connection errors and timeouts
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    except KeyboardInterrupt:
+        completed = False
+    return 0 if completed else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
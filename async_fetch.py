@@ -0,0 +1,240 @@
+import asyncio
+import logging
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import instrumentation
+from graph_api import BATCH_LIMIT, GraphAPIError
+from job_control import JobControl
+
+# Concurrent page-wide fetching: bounded concurrency, usage-aware rate limiting and backoff
+logger = logging.getLogger("PPR")
+
+
+class TokenBucket:
+    def __init__(self, rate, capacity=None, min_rate=None):
+        self.base_rate = rate
+        self.rate = rate
+        self.min_rate = min_rate or rate * 0.05
+        self.capacity = capacity or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+        self.waited = 0.0
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self, tokens=1):
+        # Takes the tokens and returns 0, or returns how long to wait before trying again
+        now = time.monotonic()
+        if now < self.paused_until:
+            delay = self.paused_until - now
+        else:
+            self._refill()
+            if self.tokens >= tokens:
+                self.tokens -= tokens
+                return 0.0
+            delay = (tokens - self.tokens) / self.rate
+        self.waited += delay
+        instrumentation.count("rate_limit_wait_seconds", delay)
+        return delay
+
+    async def acquire(self, tokens=1):
+        # Calls are serialised here, so waiters are served in arrival order
+        async with self._lock:
+            while delay := self.take(tokens):
+                await asyncio.sleep(delay)
+
+    def adjust(self, usage_percent):
+        # Slow down linearly as the reported usage approaches the quota
+        headroom = max(0.0, 100 - usage_percent) / 100
+        self.rate = max(self.min_rate, self.base_rate * headroom)
+
+    def pause(self, seconds):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+
+def backoff_delay(attempt, base=1.0, cap=60.0):
+    # Exponential backoff with full jitter
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+class Pacer:
+    # Blocking counterpart of AsyncPageFetcher._call, for the history pass and sharded workers:
+    # token bucket, usage-header slowdown and retries of throttled calls with backoff
+    def __init__(self, client, rate=20.0, max_retries=5, backoff_base=1.0, wait=None):
+        self.client = client
+        self.bucket = TokenBucket(rate, capacity=max(rate, BATCH_LIMIT))
+        self.bucket.adjust(client.usage_percent())
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        # wait(seconds) -> False when the job was stopped meanwhile; time.sleep by default
+        self.wait = wait or (lambda seconds: time.sleep(seconds) or True)
+        self.throttle_events = 0
+
+    def call(self, func, *args, cost=1, **kwargs):
+        # cost: calls the request makes, e.g. the size of a batch
+        for attempt in range(self.max_retries + 1):
+            # A stopped job makes its last request without waiting for tokens
+            while (delay := self.bucket.take(cost)) and self.wait(delay):
+                pass
+            try:
+                result = func(*args, **kwargs)
+            except GraphAPIError as e:
+                if not e.throttled or attempt == self.max_retries:
+                    raise
+                self.throttle_events += 1
+                instrumentation.count("rate_limit_throttled")
+                self.bucket.adjust(100)
+                self.bucket.pause(self.client.regain_access_seconds())
+                delay = backoff_delay(attempt, self.backoff_base)
+                logger.warning(f"Graph API throttled ({e}), retrying in {delay:.1f}s")
+                if not self.wait(delay):
+                    raise
+            else:
+                self.bucket.adjust(self.client.usage_percent())
+                return result
+
+
+class AsyncPageFetcher:
+    def __init__(self, client, concurrency=8, rate=20.0, max_retries=5, backoff_base=1.0, control=None,
+                 fetch=None, cached=None):
+        self.client = client
+        # fetch(post_ids, metrics) -> {post_id: values or GraphAPIError}, e.g. a cache-backed fetch
+        self.fetch = fetch or client.fetch_post_metrics
+        # cached(post_ids, metrics) -> {post_id: values} served without a request, so without tokens
+        self.cached = cached
+        self.concurrency = concurrency
+        self.bucket_rate = rate
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.control = control or JobControl()
+        self.throttle_events = 0
+        self.listed = 0
+        self.skipped = 0
+        self.created = {}
+        self.results = {}
+        self.bucket = None
+        # [after cursor, chunks still in flight] per listed page, oldest first
+        self._pages = []
+
+    async def _call(self, executor, func, *args, cost=1):
+        loop = asyncio.get_running_loop()
+        for attempt in range(self.max_retries + 1):
+            await self.bucket.acquire(cost)
+            try:
+                result = await loop.run_in_executor(executor, func, *args)
+            except GraphAPIError as e:
+                if not e.throttled or attempt == self.max_retries:
+                    raise
+                self.throttle_events += 1
+                instrumentation.count("rate_limit_throttled")
+                self.bucket.adjust(100)
+                self.bucket.pause(self.client.regain_access_seconds())
+                delay = backoff_delay(attempt, self.backoff_base)
+                logger.warning(f"Graph API throttled ({e}), retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+            else:
+                self.bucket.adjust(self.client.usage_percent())
+                return result
+
+    async def _wait_if_paused(self):
+        # Polling keeps the loop free to run the cancellation of the whole fetch
+        while self.control.paused:
+            await asyncio.sleep(0.05)
+
+    def _safe_cursor(self):
+        # Cursor after the last page whose posts are all done: a resumed listing starts there
+        cursor = None
+        while self._pages and self._pages[0][1] == 0:
+            cursor = self._pages.pop(0)[0]
+        return cursor
+
+    async def _fetch_chunk(self, executor, semaphore, page, post_ids, metrics, on_result, on_chunk):
+        async with semaphore:
+            await self._wait_if_paused()
+            results = {}
+            if self.cached:
+                results = await asyncio.get_running_loop().run_in_executor(executor, self.cached, post_ids, metrics)
+            remaining = [post_id for post_id in post_ids if post_id not in results]
+            if remaining:
+                try:
+                    results.update(await self._call(executor, self.fetch, remaining, metrics, cost=len(remaining)))
+                except GraphAPIError as e:
+                    results.update((post_id, e) for post_id in remaining)
+        self.results.update(results)
+        if on_result:
+            for post_id, values in results.items():
+                on_result(post_id, values)
+        page[1] -= 1
+        if on_chunk:
+            on_chunk(results, self._safe_cursor())
+
+    async def fetch_page(self, page_id, metrics, on_result=None, on_chunk=None, skip=(), after=None,
+                         chunk_size=BATCH_LIMIT):
+        # on_chunk(results, cursor) runs after each batch; cursor is set once a listing page is complete.
+        # skip and after resume an earlier run: posts already done and the listing cursor to start from.
+        self.bucket = TokenBucket(self.bucket_rate, capacity=max(self.bucket_rate, chunk_size))
+        semaphore = asyncio.Semaphore(self.concurrency)
+        tasks = []
+        executor = ThreadPoolExecutor(max_workers=self.concurrency + 1)
+        finished = False
+        try:
+            # Post listing follows cursors in order; insight batches start as soon as a page arrives
+            params = {"fields": "id,created_time", "limit": 100}
+            if after:
+                params["after"] = after
+            data = await self._call(executor, self.client.get, f"{page_id}/posts", params)
+            while True:
+                posts = data.get("data", [])
+                self.created.update((post["id"], post.get("created_time")) for post in posts)
+                post_ids = [post["id"] for post in posts if post["id"] not in skip]
+                self.listed += len(posts)
+                self.skipped += len(posts) - len(post_ids)
+                page = [data.get("paging", {}).get("cursors", {}).get("after"), 0]
+                self._pages.append(page)
+                for start in range(0, len(post_ids), chunk_size):
+                    page[1] += 1
+                    tasks.append(asyncio.create_task(self._fetch_chunk(
+                        executor, semaphore, page, post_ids[start:start + chunk_size], metrics, on_result, on_chunk)))
+                if not page[1] and on_chunk:
+                    on_chunk({}, self._safe_cursor())
+                next_url = data.get("paging", {}).get("next")
+                if not next_url:
+                    break
+                await self._wait_if_paused()
+                data = await self._call(executor, self.client.get_url, next_url)
+            await asyncio.gather(*tasks)
+            finished = True
+        finally:
+            for task in tasks:
+                task.cancel()
+            # A cancelled fetch does not wait for requests still in flight; their results are dropped
+            executor.shutdown(wait=finished, cancel_futures=True)
+        return self.results
+
+    async def _run(self, page_id, metrics, **kwargs):
+        task = asyncio.current_task()
+        loop = asyncio.get_running_loop()
+
+        def cancel():
+            # May run from another thread, or after this loop is gone
+            try:
+                loop.call_soon_threadsafe(task.cancel)
+            except RuntimeError:
+                pass
+        self.control.on_cancel(cancel)
+        try:
+            return await self.fetch_page(page_id, metrics, **kwargs)
+        except asyncio.CancelledError:
+            logger.info(f"Page fetch cancelled after {len(self.results)} posts")
+            return self.results
+
+    def run(self, page_id, metrics, **kwargs):
+        # Returns the results so far, also when the job is cancelled midway
+        return asyncio.run(self._run(page_id, metrics, **kwargs))
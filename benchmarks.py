@@ -0,0 +1,267 @@
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import numpy as np
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Benchmarks for the fetch, report and export paths against a local graph_stub.py server.
+# Every scenario runs in its own process, so peak RSS is per scenario.
+logger = logging.getLogger("PPR")
+
+SCENARIOS = {}
+
+# Relative change beyond which a result counts as a regression; "higher" marks where bigger is worse
+COMPARED = {"p50_ms": "higher", "p99_ms": "higher", "requests": "higher", "peak_rss_mb": "higher",
+            "throughput": "lower"}
+
+
+class Scenario:
+    def __init__(self, name, func, unit, setup):
+        self.name = name
+        self.func = func
+        self.unit = unit
+        self.setup = setup
+
+
+def scenario(name, unit, setup=None):
+    # func(engine, options) -> units processed in one iteration; setup(engine, options) runs untimed first
+    def register(func):
+        SCENARIOS[name] = Scenario(name, func, unit, setup)
+        return func
+    return register
+
+
+def quiet(line):
+    pass
+
+
+def sync_history(engine, options):
+    engine.sync_page(log=quiet, rate=options["rate"], history=True, restart=True)
+
+
+@scenario("single_post", unit="posts")
+def single_post(engine, options):
+    engine.analyze_posts([f"{options['page_id']}_1"], log=quiet)
+    return 1
+
+
+@scenario("page_sync", unit="posts")
+def page_sync(engine, options):
+    engine.sync_page(log=quiet, rate=options["rate"], restart=True)
+    return options["posts"]
+
+
+@scenario("report", unit="sections", setup=sync_history)
+def report(engine, options):
+    engine.generate_report(log=quiet)
+    return sum(1 for line in engine.results if line.startswith("\n---"))
+
+
+@scenario("export", unit="records", setup=sync_history)
+def export(engine, options):
+    path = os.path.join(engine.data_dir, f"bench.{options['export_format']}")
+    _, records = engine.export_records(path, fmt=options["export_format"])
+    return records
+
+
+def fetch_history(engine, options, decode):
+    # Decodes the full insights history of every post and holds all of it in memory at once
+    from urllib.parse import urlencode
+
+    from graph_api import INSIGHT_METRICS
+
+    names = ",".join(INSIGHT_METRICS.values())
+    query = urlencode({"metric": names, "period": "day", "limit": 90}, safe=",")
+    post_ids = [post["id"] for post in engine.client.page_posts(options["page_id"])]
+    calls = [{"method": "GET", "relative_url": f"{post_id}/insights?{query}"} for post_id in post_ids]
+    pages = []
+    for body, _ in engine.client.batch(calls, decode=decode):
+        while body:
+            pages.append(body)
+            next_url = body.get("paging", {}).get("next")
+            body = engine.client.get_url(next_url, decode=decode) if next_url else None
+    return sum(len(item["values"]) for page in pages for item in page.get("data", []))
+
+
+@scenario("history_dicts", unit="points")
+def history_dicts(engine, options):
+    # Baseline for history_records: plain JSON, a dict and a timestamp string per datapoint
+    return fetch_history(engine, options, json.loads)
+
+
+@scenario("history_records", unit="points")
+def history_records(engine, options):
+    from records import decode_insights
+
+    return fetch_history(engine, options, decode_insights)
+
+
+@scenario("startup", unit="launches")
+def startup(engine, options):
+    # Cold CLI start in a new interpreter: imports, argument parsing, exit
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "post_performance_report.py")
+    subprocess.run([sys.executable, script, "--help"], check=True, stdout=subprocess.DEVNULL)
+    return 1
+
+
+@scenario("gui_start", unit="launches")
+def gui_start(engine, options):
+    # Cold GUI start up to the login window in a new interpreter; fails if that already loads the engine
+    code = ("import importlib.util, sys; import post_performance_report as gui; "
+            "importlib.util.find_spec('tkinter') and gui.load_tk(); sys.exit('analytics_engine' in sys.modules)")
+    subprocess.run([sys.executable, "-c", code], check=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+    return 1
+
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024 if sys.platform == "darwin" else 1024)
+
+
+def run_scenario(name, graph_url, options):
+    # Runs in a fresh process; the engine is uncached so every iteration hits the stub
+    from analytics_engine import AnalyticsEngine
+
+    logging.basicConfig(level=logging.WARNING)
+    item = SCENARIOS[name]
+    with tempfile.TemporaryDirectory() as data_dir:
+        engine = AnalyticsEngine(data_dir, use_cache=False)
+        engine.config["graph_url"] = graph_url
+        engine.connect("bench", options["token"], options["page_id"])
+        if item.setup:
+            item.setup(engine, options)
+        for _ in range(options["warmup"]):
+            item.func(engine, options)
+
+        latencies = []
+        units = 0
+        requests_before = engine.client.request_count
+        for _ in range(options["iterations"]):
+            start = time.perf_counter()
+            units += item.func(engine, options)
+            latencies.append(time.perf_counter() - start)
+        requests = engine.client.request_count - requests_before
+        engine.client.close()
+
+    total = sum(latencies)
+    p50, p99 = np.percentile(latencies, [50, 99]) * 1000
+    return {"iterations": len(latencies), "p50_ms": round(p50, 2), "p99_ms": round(p99, 2),
+            "mean_ms": round(total / len(latencies) * 1000, 2),
+            "requests": requests / len(latencies), "rps": round(requests / total, 1) if total else 0.0,
+            "throughput": round(units / total, 1) if total else 0.0, "unit": f"{item.unit}/s",
+            "peak_rss_mb": round(peak_rss_mb(), 1) if resource else None}
+
+
+def run_benchmarks(names, options):
+    from graph_stub import STUB_TOKEN, GraphStub
+
+    options = dict(options, token=STUB_TOKEN)
+    results = {}
+    with GraphStub(page_id=options["page_id"], posts=options["posts"], history_days=options["history_days"],
+                   latency=options["latency"]) as stub:
+        for name in names:
+            # spawn: each scenario starts from a clean interpreter
+            with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as pool:
+                results[name] = pool.submit(run_scenario, name, stub.url, options).result()
+            logger.info(f"Benchmark {name}: {results[name]}")
+    return results
+
+
+def compare(results, baseline, threshold):
+    # [(scenario, key, baseline value, current value, relative change)] beyond the threshold
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get("scenarios", {}).get(name)
+        if not previous:
+            continue
+        for key, worse in COMPARED.items():
+            old, new = previous.get(key), current.get(key)
+            if not old or new is None:
+                continue
+            change = (new - old) / old
+            if (change > threshold) if worse == "higher" else (change < -threshold):
+                regressions.append((name, key, old, new, change))
+    return regressions
+
+
+def print_results(results):
+    print(f"{'scenario':<16} {'p50 ms':>9} {'p99 ms':>9} {'req/iter':>9} {'req/s':>8} {'throughput':>18} {'RSS MB':>8}")
+    for name, r in results.items():
+        rss = f"{r['peak_rss_mb']:.1f}" if r["peak_rss_mb"] is not None else "n/a"
+        print(f"{name:<16} {r['p50_ms']:>9.2f} {r['p99_ms']:>9.2f} {r['requests']:>9.1f} {r['rps']:>8.1f} "
+              f"{r['throughput']:>10.1f} {r['unit']:<7} {rss:>8}")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Benchmark the analytics engine against a local Graph API stub")
+    parser.add_argument("scenarios", nargs="*", metavar="scenario",
+                        help=f"scenarios to run (default: all of {', '.join(SCENARIOS)})")
+    parser.add_argument("--iterations", type=int, default=10)
+    parser.add_argument("--warmup", type=int, default=1, help="untimed iterations first")
+    parser.add_argument("--posts", type=int, default=500, help="posts on the stub page")
+    parser.add_argument("--history-days", type=int, default=30, help="daily datapoints per post and metric")
+    parser.add_argument("--latency", type=float, default=0.02, help="seconds the stub adds to every request")
+    parser.add_argument("--rate", type=float, default=1000.0,
+                        help="sync rate limit in calls per second (default high, so the limiter does not dominate)")
+    parser.add_argument("--page-id", default="1000")
+    parser.add_argument("--export-format", choices=["jsonl", "csv", "parquet"], default="jsonl")
+    parser.add_argument("--save", metavar="FILE", help="write the results as a JSON baseline")
+    parser.add_argument("--baseline", metavar="FILE", help="compare against a saved baseline")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="relative change that counts as a regression (default: 0.2)")
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    unknown = [name for name in args.scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenario: {', '.join(unknown)}")
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    options = {"iterations": args.iterations, "warmup": args.warmup, "posts": args.posts,
+               "history_days": args.history_days, "latency": args.latency, "rate": args.rate,
+               "page_id": args.page_id,
+               "export_format": args.export_format}
+    results = run_benchmarks(args.scenarios or list(SCENARIOS), options)
+    print_results(results)
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump({"created": datetime.now().isoformat(timespec="seconds"), "python": platform.python_version(),
+                       "options": options, "scenarios": results}, f, indent=4)
+        print(f"Baseline saved to {args.save}")
+
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+        if baseline.get("options") != options:
+            print("Warning: baseline was recorded with different options", file=sys.stderr)
+        regressions = compare(results, baseline, args.threshold)
+        for name, key, old, new, change in regressions:
+            print(f"REGRESSION {name} {key}: {old} -> {new} ({change:+.0%})")
+        if regressions:
+            return 1
+        print(f"No regressions beyond {args.threshold:.0%}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,351 @@
+import json
+import logging
+import os
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+
+import instrumentation
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# Columnar time-series store: per metric, three parallel columns (post code, time, value)
+# appended as raw binary files and read back memory-mapped
+logger = logging.getLogger("PPR")
+
+POST_DTYPE = np.int32
+TIME_DTYPE = np.int64
+VALUE_DTYPE = np.float64
+COLUMNS = (("post", POST_DTYPE), ("time", TIME_DTYPE), ("value", VALUE_DTYPE))
+
+DAY = 24 * 3600
+
+
+class Column:
+    def __init__(self, post, time, value):
+        self.post = post
+        self.time = time
+        self.value = value
+
+    def __len__(self):
+        return len(self.value)
+
+
+def _read(path, dtype):
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return np.empty(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode="r")
+
+
+def lifetime(metric):
+    # Column holding fetched lifetime totals, next to the daily series of the same metric
+    return f"{metric}.lifetime"
+
+
+def latest_rows(post, time):
+    # Sort by (post, time) and keep the last written row for each pair, so re-fetched points win
+    order = np.lexsort((np.arange(len(post)), time, post))
+    post, time = post[order], time[order]
+    last = np.ones(len(order), dtype=bool)
+    last[:-1] = (post[1:] != post[:-1]) | (time[1:] != time[:-1])
+    return order[last]
+
+
+def _rows_between(post, low, high, step):
+    # Indices of the rows whose post code is in [low, high), scanning `step` rows at a time
+    return np.concatenate([np.flatnonzero((post[start:start + step] >= low) & (post[start:start + step] < high))
+                           + start for start in range(0, len(post), step)])
+
+
+def _stat(path):
+    # Changes whenever the file is rewritten or appended to
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+
+class ColumnStore:
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        # Several processes may write the same store (a sync and the webhook receiver): writes take
+        # the thread lock and an exclusive lock on this file
+        self._lock = threading.RLock()
+        self._lock_file = open(os.path.join(path, ".lock"), 'a+')
+        self._lock_depth = 0
+        self._cache = {}
+        # listener(store, metric, codes, times, values) runs after every write, under the store lock
+        self.listeners = []
+        self.post_ids = []
+        self.created = []
+        self.codes = {}
+        self._posts_dirty = False
+        self._posts_stat = None
+        self._load_posts()
+
+    @contextmanager
+    def locked(self):
+        # Reentrant; the post table is reloaded on entry, so codes added by other processes are reused
+        with self._lock:
+            if not self._lock_depth:
+                if fcntl:
+                    fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+                else:
+                    self._lock_file.seek(0)
+                    msvcrt.locking(self._lock_file.fileno(), msvcrt.LK_LOCK, 1)
+                self._refresh_posts()
+            self._lock_depth += 1
+            try:
+                yield
+            finally:
+                self._lock_depth -= 1
+                if not self._lock_depth:
+                    if fcntl:
+                        fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+                    else:
+                        self._lock_file.seek(0)
+                        msvcrt.locking(self._lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+
+    def _load_posts(self):
+        posts_path = os.path.join(self.path, "posts.json")
+        self._posts_stat = _stat(posts_path)
+        if self._posts_stat:
+            with open(posts_path, 'r') as f:
+                posts = json.load(f)
+            self.post_ids = posts["ids"]
+            self.created = posts["created"]
+        self.codes = {post_id: code for code, post_id in enumerate(self.post_ids)}
+
+    def _refresh_posts(self):
+        # Picks up posts saved by another process; codes only ever get appended
+        with self._lock:
+            if not self._posts_dirty and _stat(os.path.join(self.path, "posts.json")) != self._posts_stat:
+                self._load_posts()
+
+    def _save_posts(self):
+        # Before the rows that use the new codes, so readers never see a code they cannot resolve
+        if not self._posts_dirty:
+            return
+        self._posts_dirty = False
+        posts_path = os.path.join(self.path, "posts.json")
+        with open(posts_path + ".tmp", 'w') as f:
+            json.dump({"ids": self.post_ids, "created": self.created}, f)
+        os.replace(posts_path + ".tmp", posts_path)
+        self._posts_stat = _stat(posts_path)
+
+    def _code(self, post_id, created_time=None):
+        code = self.codes.get(post_id)
+        if code is None:
+            code = len(self.post_ids)
+            self.codes[post_id] = code
+            self.post_ids.append(post_id)
+            self.created.append(created_time or 0)
+            self._posts_dirty = True
+        elif created_time and not self.created[code]:
+            self.created[code] = created_time
+            self._posts_dirty = True
+        return code
+
+    def add_posts(self, posts):
+        # posts: [(post_id, created_time epoch seconds)]
+        with self.locked():
+            for post_id, created_time in posts:
+                self._code(post_id, created_time)
+            self._save_posts()
+
+    def metrics(self):
+        return sorted(name for name in os.listdir(self.path) if os.path.isdir(os.path.join(self.path, name)))
+
+    def append(self, post_id, metric, points):
+        self.append_many(metric, [(post_id, end_time, value) for end_time, value in points])
+
+    def append_many(self, metric, rows):
+        # rows: [(post_id, time, value)], written with one sequential write per column
+        if not rows:
+            return
+        with self.locked():
+            codes = np.fromiter((self._code(post_id) for post_id, _, _ in rows), dtype=POST_DTYPE, count=len(rows))
+            times = np.fromiter((time for _, time, _ in rows), dtype=TIME_DTYPE, count=len(rows))
+            values = np.fromiter((value for _, _, value in rows), dtype=VALUE_DTYPE, count=len(rows))
+            self._save_posts()
+            self._write(metric, codes, times, values)
+
+    def _write(self, metric, codes, times, values):
+        # Caller holds locked()
+        directory = os.path.join(self.path, metric)
+        os.makedirs(directory, exist_ok=True)
+        for (name, dtype), data in zip(COLUMNS, (codes, times, values)):
+            with open(os.path.join(directory, f"{name}.bin"), 'ab') as f:
+                f.write(np.asarray(data, dtype=dtype).tobytes())
+        self._cache.pop(metric, None)
+        for listener in self.listeners:
+            listener(self, metric, codes, times, values)
+
+    def merge(self, other):
+        # Appends every column of another store (e.g. a shard segment), remapping its post codes to ours
+        with self.locked():
+            mapping = np.fromiter((self._code(post_id, created) for post_id, created in zip(other.post_ids, other.created)),
+                                  dtype=POST_DTYPE, count=len(other.post_ids))
+            self._save_posts()
+        rows = 0
+        for metric in other.metrics():
+            for posts, times, values in other.iter_chunks(metric):
+                with self.locked():
+                    self._write(metric, mapping[posts], times, values)
+                rows += len(values)
+        return rows
+
+    def row_count(self, metric):
+        # Raw rows written so far, superseded ones included
+        directory = os.path.join(self.path, metric)
+        counts = [os.path.getsize(os.path.join(directory, f"{name}.bin")) // np.dtype(dtype).itemsize
+                  if os.path.exists(os.path.join(directory, f"{name}.bin")) else 0 for name, dtype in COLUMNS]
+        return min(counts)
+
+    def column(self, metric):
+        # Deduplicated and sorted by (post, time); cached until the files change, here or in another process
+        directory = os.path.join(self.path, metric)
+        with self._lock:
+            stats = tuple(_stat(os.path.join(directory, f"{name}.bin")) for name, _ in COLUMNS)
+            if metric in self._cache and self._cache[metric][0] == stats:
+                return self._cache[metric][1]
+            self._refresh_posts()
+            post, time, value = (_read(os.path.join(directory, f"{name}.bin"), dtype) for name, dtype in COLUMNS)
+            rows = min(len(post), len(time), len(value))  # ignore a torn trailing write
+            post, time, value = post[:rows], time[:rows], value[:rows]
+            if rows:
+                keep = latest_rows(post, time)
+                column = Column(post[keep], time[keep], value[keep])
+            else:
+                column = Column(post, time, value)
+            self._cache[metric] = (stats, column)
+            return column
+
+    def iter_chunks(self, metric, chunk_size=65536, block_rows=1 << 18):
+        # Streams deduplicated (post codes, times, values) chunks in (post, time) order straight from the
+        # mapped files. Posts are taken in ranges of about block_rows raw rows, each gathered with one pass
+        # over the post column, so memory is bounded by the block rather than by the column.
+        directory = os.path.join(self.path, metric)
+        post, time, value = (_read(os.path.join(directory, f"{name}.bin"), dtype) for name, dtype in COLUMNS)
+        rows = min(len(post), len(time), len(value))
+        if not rows:
+            return
+        self._refresh_posts()
+        post, time, value = post[:rows], time[:rows], value[:rows]
+        slices = range(0, rows, block_rows)
+        counts = np.zeros(len(self.post_ids), dtype=np.int64)
+        for start in slices:
+            piece = np.bincount(post[start:start + block_rows], minlength=len(counts))
+            counts = np.pad(counts, (0, len(piece) - len(counts))) + piece
+        cumulative = np.cumsum(counts)
+        low = 0
+        while low < len(counts):
+            base = cumulative[low - 1] if low else 0
+            high = max(low + 1, int(np.searchsorted(cumulative, base + block_rows, side='right')))
+            if cumulative[high - 1] > base:
+                index = _rows_between(post, low, high, block_rows)
+                index = index[latest_rows(post[index], time[index])]
+                for start in range(0, len(index), chunk_size):
+                    chunk = index[start:start + chunk_size]
+                    yield post[chunk], time[chunk], value[chunk]
+            low = high
+
+    def previous_values(self, metric, codes, times, rows):
+        # Value each (post code, time) pair last had within the first `rows` raw rows, NaN if it was never
+        # written. Scans the post column once; only the rows of the given posts are read beyond that.
+        directory = os.path.join(self.path, metric)
+        post = _read(os.path.join(directory, "post.bin"), POST_DTYPE)[:rows]
+        wanted = np.zeros(len(self.post_ids), dtype=bool)
+        wanted[codes] = True
+        match = np.flatnonzero(wanted[post])
+        post = post[match]
+        time = _read(os.path.join(directory, "time.bin"), TIME_DTYPE)[match]
+        value = _read(os.path.join(directory, "value.bin"), VALUE_DTYPE)[match]
+        if not len(match):
+            return np.full(len(codes), np.nan)
+        keep = latest_rows(post, time)
+        # (post, time) pairs sorted as one key; epoch seconds fit in the low 32 bits
+        stored = post[keep].astype(np.int64) << 32 | time[keep]
+        keys = codes.astype(np.int64) << 32 | times
+        index = np.minimum(np.searchsorted(stored, keys), len(stored) - 1)
+        return np.where(stored[index] == keys, value[keep][index], np.nan)
+
+    def compact(self, metric):
+        # Rewrite the files without superseded rows
+        with self.locked():
+            column = self.column(metric)
+            directory = os.path.join(self.path, metric)
+            for (name, dtype), data in zip(COLUMNS, (column.post, column.time, column.value)):
+                target = os.path.join(directory, f"{name}.bin")
+                np.asarray(data, dtype=dtype).tofile(target + ".tmp")
+                os.replace(target + ".tmp", target)
+            self._cache.pop(metric, None)
+
+    def created_times(self):
+        return np.asarray(self.created, dtype=TIME_DTYPE)
+
+    def close(self):
+        self._lock_file.close()
+
+
+# Vectorised aggregations over whole columns
+
+def post_totals(column, n_posts, cumulative=False):
+    # Daily series sum up; cumulative counters (shares, comments...) take their latest value
+    totals = np.zeros(n_posts, dtype=VALUE_DTYPE)
+    if not len(column):
+        return totals
+    instrumentation.count("rows_aggregated", len(column))
+    if cumulative:
+        last = np.ones(len(column), dtype=bool)
+        last[:-1] = column.post[1:] != column.post[:-1]
+        totals[column.post[last]] = column.value[last]
+        return totals
+    return np.bincount(column.post, weights=column.value, minlength=n_posts)[:n_posts]
+
+
+def engagement_rate(engagement, reach):
+    # Overall rate and per-post rates in percent; posts without reach get 0
+    per_post = np.divide(engagement, reach, out=np.zeros_like(engagement), where=reach > 0) * 100
+    overall = engagement.sum() / reach.sum() * 100 if reach.sum() else 0.0
+    return overall, per_post
+
+
+def bucket_totals(times, values, size, offset=0):
+    # (bucket start times, totals) for every bucket of `size` seconds with data; offset shifts the bucket edges
+    if not len(times):
+        return np.empty(0, dtype=TIME_DTYPE), np.empty(0, dtype=VALUE_DTYPE)
+    instrumentation.count("rows_aggregated", len(times))
+    buckets, inverse = np.unique((np.asarray(times) + offset) // size, return_inverse=True)
+    return buckets * size - offset, np.bincount(inverse, weights=values)
+
+
+def daily_totals(column):
+    # (day start times, totals) for every day with data
+    return bucket_totals(column.time, column.value, DAY)
+
+
+def growth(days, totals, window_days=7):
+    # Daily totals of the latest window against the window before it, in percent
+    if not len(days):
+        return 0.0, 0.0, None
+    end = days[-1] + DAY
+    current = totals[days >= end - window_days * DAY].sum()
+    previous = totals[(days >= end - 2 * window_days * DAY) & (days < end - window_days * DAY)].sum()
+    change = (current - previous) / previous * 100 if previous else None
+    return current, previous, change
+
+
+def hour_of_day(times):
+    return (times // 3600) % 24
+
+
+def weekday(times):
+    return (times // DAY + 3) % 7  # 1970-01-01 was a Thursday; 0 = Monday
@@ -0,0 +1,142 @@
+import csv
+import gzip
+import importlib
+import io
+import json
+import logging
+import os
+import time
+from datetime import datetime, timezone
+
+import instrumentation
+
+# Streaming metric exports: records are written chunk by chunk, never collected in memory
+logger = logging.getLogger("PPR")
+
+FIELDS = ("post_id", "metric", "end_time", "value")
+FORMATS = ("jsonl", "csv", "parquet")
+COMPRESSIONS = (None, "gzip", "zstd")
+EXTENSIONS = {"jsonl": ".jsonl", "csv": ".csv", "parquet": ".parquet", "gzip": ".gz", "zstd": ".zst"}
+
+
+def iso_time(epoch):
+    return datetime.fromtimestamp(int(epoch), tz=timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def export_filename(fmt, compression=None):
+    name = f"facebook_analytics_{datetime.now().strftime('%Y%m%d_%H%M%S')}{EXTENSIONS[fmt]}"
+    if compression and fmt != "parquet":
+        name += EXTENSIONS[compression]
+    return name
+
+
+def rows_to_chunk(rows):
+    # [(post_id, metric, end_time, value)] -> {field: column}
+    columns = list(zip(*rows)) if rows else [(), (), (), ()]
+    return dict(zip(FIELDS, columns))
+
+
+def _optional(module, purpose):
+    # Parquet output and zstd compression are optional, and only imported when used
+    try:
+        return importlib.import_module(module)
+    except ImportError:
+        raise RuntimeError(f"{purpose} needs the {module.split('.')[0]} package "
+                           f"(pip install {module.split('.')[0]})") from None
+
+
+def _open_text(path, compression):
+    if compression is None:
+        return open(path, 'w', newline='', encoding='utf-8')
+    if compression == "gzip":
+        return gzip.open(path, 'wt', newline='', encoding='utf-8')
+    if compression == "zstd":
+        zstandard = _optional("zstandard", "zstd compression")
+        raw = open(path, 'wb')
+        return io.TextIOWrapper(zstandard.ZstdCompressor().stream_writer(raw, closefd=True),
+                                newline='', encoding='utf-8')
+    raise ValueError(f"Unknown compression: {compression}")
+
+
+class JSONLWriter:
+    def __init__(self, path, compression=None):
+        self.file = _open_text(path, compression)
+
+    def write(self, chunk):
+        lines = [json.dumps({"post_id": post_id, "metric": metric, "end_time": iso_time(end_time),
+                             "value": float(value)})
+                 for post_id, metric, end_time, value in zip(*(chunk[field] for field in FIELDS))]
+        if lines:
+            self.file.write("\n".join(lines) + "\n")
+
+    def close(self):
+        self.file.close()
+
+
+class CSVWriter:
+    def __init__(self, path, compression=None):
+        self.file = _open_text(path, compression)
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(FIELDS)
+
+    def write(self, chunk):
+        self.writer.writerows((post_id, metric, iso_time(end_time), float(value))
+                              for post_id, metric, end_time, value in zip(*(chunk[field] for field in FIELDS)))
+
+    def close(self):
+        self.file.close()
+
+
+class ParquetWriter:
+    def __init__(self, path, compression=None):
+        pyarrow = _optional("pyarrow", "Parquet export")
+        _optional("pyarrow.parquet", "Parquet export")
+        self.pyarrow = pyarrow
+        self.schema = pyarrow.schema([("post_id", pyarrow.string()), ("metric", pyarrow.string()),
+                                      ("end_time", pyarrow.timestamp("s", tz="UTC")),
+                                      ("value", pyarrow.float64())])
+        # Each chunk becomes (at least) one row group
+        self.writer = pyarrow.parquet.ParquetWriter(path, self.schema, compression=compression or "snappy")
+
+    def write(self, chunk):
+        if len(chunk["value"]):
+            self.writer.write_table(self.pyarrow.table({field: chunk[field] for field in FIELDS}, schema=self.schema))
+
+    def close(self):
+        self.writer.close()
+
+
+WRITERS = {"jsonl": JSONLWriter, "csv": CSVWriter, "parquet": ParquetWriter}
+
+
+class RecordExporter:
+    def __init__(self, path, fmt="jsonl", compression=None):
+        if fmt not in FORMATS:
+            raise ValueError(f"Unknown export format: {fmt}")
+        if compression not in COMPRESSIONS:
+            raise ValueError(f"Unknown compression: {compression}")
+        self.path = path
+        self.fmt = fmt
+        self.records = 0
+        self.writer = WRITERS[fmt](path, compression)
+
+    def write(self, chunk):
+        start = time.perf_counter()
+        self.writer.write(chunk)
+        self.records += len(chunk["value"])
+        # records / export_write_seconds total = export throughput
+        instrumentation.observe("export_write_seconds", time.perf_counter() - start, format=self.fmt)
+        instrumentation.count("export_records", len(chunk["value"]), format=self.fmt)
+
+    def write_rows(self, rows):
+        self.write(rows_to_chunk(rows))
+
+    def close(self):
+        self.writer.close()
+        logger.info(f"Exported {self.records} records to {self.path} ({os.path.getsize(self.path)} bytes)")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
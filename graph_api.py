@@ -0,0 +1,302 @@
+import hashlib
+import hmac
+import json
+import logging
+import re
+import threading
+import time
+from datetime import datetime
+from urllib.parse import urlencode, urlparse, parse_qs
+
+import instrumentation
+
+logger = logging.getLogger("PPR")
+
+GRAPH_URL = "https://graph.facebook.com"
+GRAPH_VERSION = "v19.0"
+BATCH_LIMIT = 50  # Graph API maximum requests per batch call
+USAGE_HEADERS = ("X-App-Usage", "X-Page-Usage")
+
+# Rate limit / throttling error codes that are worth retrying
+THROTTLE_CODES = {4, 17, 32, 613, 80001}
+
+# Returned instead of a body when an If-None-Match request gets HTTP 304
+NOT_MODIFIED = object()
+
+# Analytics metric -> Graph insights metric
+INSIGHT_METRICS = {
+    "engagement": "post_engaged_users",
+    "reach": "post_impressions_unique",
+    "impressions": "post_impressions",
+    "clicks": "post_clicks",
+}
+
+# Analytics metric -> post field (counted from the object itself, not insights)
+FIELD_METRICS = {
+    "shares": "shares",
+    "comments": "comments.summary(true).limit(0)",
+    "reactions": "reactions.summary(true).limit(0)",
+}
+
+
+class GraphAPIError(Exception):
+    def __init__(self, message, code=None, subcode=None, status=None):
+        super().__init__(message)
+        self.code = code
+        self.subcode = subcode
+        self.status = status
+
+    @property
+    def throttled(self):
+        return self.code in THROTTLE_CODES or self.status == 429
+
+
+def post_id_from_url(url, page_id):
+    # Accept Graph ids as-is ("<page>_<post>" or a bare numeric id)
+    if re.fullmatch(r"\d+(_\d+)?", url):
+        return url
+
+    parsed = urlparse(url)
+    query = parse_qs(parsed.query)
+    if "story_fbid" in query:
+        owner = query.get("id", [page_id])[0]
+        return f"{owner}_{query['story_fbid'][0]}"
+    if "fbid" in query:
+        return query["fbid"][0]
+
+    match = re.search(r"/(?:posts|videos|permalink)/(\w+)", parsed.path)
+    if match:
+        return f"{page_id}_{match.group(1)}"
+    raise ValueError(f"Could not find a post id in {url}")
+
+
+def post_fields(metrics):
+    # One field list that returns every requested metric in a single response
+    fields = ["id", "created_time"]
+    fields += [FIELD_METRICS[m] for m in metrics if m in FIELD_METRICS]
+    insights = [INSIGHT_METRICS[m] for m in metrics if m in INSIGHT_METRICS]
+    if insights:
+        fields.append(f"insights.metric({','.join(insights)})")
+    return ",".join(fields)
+
+
+def parse_time(value):
+    # Graph timestamps look like 2024-01-01T08:00:00+0000. fromisoformat is far cheaper than strptime
+    # and takes this form from Python 3.11 on; older versions fall back.
+    try:
+        return int(datetime.fromisoformat(value).timestamp())
+    except ValueError:
+        return int(datetime.strptime(value, "%Y-%m-%dT%H:%M:%S%z").timestamp())
+
+
+def parse_post_metrics(data, metrics):
+    values = {}
+    insights = {item["name"]: item for item in data.get("insights", {}).get("data", [])}
+    for metric in metrics:
+        if metric in INSIGHT_METRICS:
+            item = insights.get(INSIGHT_METRICS[metric])
+            values[metric] = item["values"][-1]["value"] if item and item.get("values") else 0
+        elif metric == "shares":
+            values[metric] = data.get("shares", {}).get("count", 0)
+        elif metric in FIELD_METRICS:
+            values[metric] = data.get(metric, {}).get("summary", {}).get("total_count", 0)
+    return values
+
+
+class GraphAPIClient:
+    def __init__(self, access_token, app_secret="", base_url=GRAPH_URL, version=GRAPH_VERSION,
+                 timeout=10, pool_size=10):
+        self.access_token = access_token
+        self.app_secret = app_secret
+        self.base_url = base_url.rstrip("/")
+        self.version = version
+        self.timeout = timeout
+        self.request_count = 0
+        self.bytes_received = 0
+        self.usage = {}
+
+        self.pool_size = pool_size
+        self._session = None
+        self._session_lock = threading.Lock()
+
+    @property
+    def session(self):
+        # One pooled keep-alive session for every call. requests is imported here, on the first
+        # request, so starting the app does not pay for the network stack.
+        with self._session_lock:
+            if self._session is None:
+                import requests
+                from requests.adapters import HTTPAdapter
+
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                self._session = session
+            return self._session
+
+    def _url(self, path=""):
+        return f"{self.base_url}/{self.version}/{path.lstrip('/')}"
+
+    def _auth_params(self):
+        params = {"access_token": self.access_token}
+        if self.app_secret:
+            params["appsecret_proof"] = hmac.new(self.app_secret.encode(), self.access_token.encode(),
+                                                 hashlib.sha256).hexdigest()
+        return params
+
+    def _record_usage(self, response):
+        for header in USAGE_HEADERS:
+            value = response.headers.get(header)
+            if value:
+                try:
+                    self.usage[header] = json.loads(value)
+                except ValueError:
+                    logger.warning(f"Ignoring malformed {header} header: {value}")
+
+    def usage_percent(self):
+        # Highest share of any quota the app or page has used, 0-100
+        percents = [v for usage in self.usage.values() for k, v in usage.items()
+                    if k in ("call_count", "total_time", "total_cputime") and isinstance(v, (int, float))]
+        return max(percents, default=0)
+
+    def regain_access_seconds(self):
+        minutes = max((usage.get("estimated_time_to_regain_access", 0) for usage in self.usage.values()), default=0)
+        return minutes * 60
+
+    def _send(self, kind, method, url, **kwargs):
+        start = time.perf_counter()
+        response = self.session.request(method, url, timeout=self.timeout, **kwargs)
+        self.request_count += 1
+        self.bytes_received += len(response.content)
+        instrumentation.observe("graph_request_seconds", time.perf_counter() - start, kind=kind)
+        instrumentation.count("graph_bytes_received", len(response.content))
+        return response
+
+    def _decode(self, response, decode=None):
+        # decode: parses the body text instead of response.json(), e.g. straight into records
+        self._record_usage(response)
+        try:
+            data = decode(response.text) if decode else response.json()
+        except ValueError:
+            raise GraphAPIError(f"Invalid response from Graph API (HTTP {response.status_code})",
+                                status=response.status_code)
+        if isinstance(data, dict) and "error" in data:
+            error = data["error"]
+            raise GraphAPIError(error.get("message", "Unknown Graph API error"), code=error.get("code"),
+                                subcode=error.get("error_subcode"), status=response.status_code)
+        if response.status_code >= 400:
+            raise GraphAPIError(f"Graph API returned HTTP {response.status_code}", status=response.status_code)
+        return data
+
+    def get(self, path, params=None):
+        return self.get_conditional(path, params)[0]
+
+    def get_conditional(self, path, params=None, etag=None):
+        # Returns (body, etag); body is NOT_MODIFIED when the server confirms our etag
+        query = dict(params or {})
+        query.update(self._auth_params())
+        headers = {"If-None-Match": etag} if etag else None
+        response = self._send("get", "GET", self._url(path), params=query, headers=headers)
+        if etag and response.status_code == 304:
+            self._record_usage(response)
+            return NOT_MODIFIED, etag
+        return self._decode(response), response.headers.get("ETag")
+
+    def get_url(self, url, decode=None):
+        # paging.next / paging.previous links already carry the access token
+        response = self._send("page", "GET", url)
+        return self._decode(response, decode)
+
+    def paginate(self, path, params=None):
+        # Lazily follows paging.next, one request per page of results
+        data = self.get(path, params)
+        while True:
+            yield from data.get("data", [])
+            next_url = data.get("paging", {}).get("next")
+            if not next_url:
+                return
+            data = self.get_url(next_url)
+
+    def page_posts(self, page_id, fields="id,created_time", limit=100):
+        return self.paginate(f"{page_id}/posts", {"fields": fields, "limit": limit})
+
+    def validate(self, page_id):
+        return self.get(page_id, {"fields": "id,name"})
+
+    def post_metrics(self, post_id, metrics):
+        return self.post_metrics_conditional(post_id, metrics)[0]
+
+    def post_metrics_conditional(self, post_id, metrics, etag=None):
+        data, etag = self.get_conditional(post_id, {"fields": post_fields(metrics)}, etag)
+        if data is NOT_MODIFIED:
+            return data, etag
+        return parse_post_metrics(data, metrics), etag
+
+    def insights(self, object_id, metrics, **params):
+        query = {"metric": ",".join(metrics)}
+        query.update(params)
+        return self.get(f"{object_id}/insights", query)
+
+    def batch(self, calls, decode=json.loads):
+        # calls: list of {"method": ..., "relative_url": ..., "headers": [...]}
+        # Returns (body, etag) pairs in call order; body may be a GraphAPIError or NOT_MODIFIED.
+        # decode parses each call's body.
+        results = []
+        for start in range(0, len(calls), BATCH_LIMIT):
+            chunk = calls[start:start + BATCH_LIMIT]
+            data = dict(self._auth_params())
+            data["batch"] = json.dumps(chunk)
+            response = self._send("batch", "POST", self._url(), data=data)
+            for item in self._decode(response):
+                results.append(self._decode_batch_item(item, decode))
+        return results
+
+    def _decode_batch_item(self, item, decode=json.loads):
+        if item is None:
+            return GraphAPIError("Batch request timed out"), None
+        headers = {header["name"].lower(): header["value"] for header in item.get("headers") or []}
+        etag = headers.get("etag")
+        if item.get("code") == 304:
+            return NOT_MODIFIED, etag
+        try:
+            body = decode(item.get("body") or "null")
+        except ValueError:
+            return GraphAPIError("Invalid batch response body", status=item.get("code")), None
+        if isinstance(body, dict) and "error" in body:
+            error = body["error"]
+            return GraphAPIError(error.get("message", "Unknown Graph API error"), code=error.get("code"),
+                                 subcode=error.get("error_subcode"), status=item.get("code")), None
+        return body, etag
+
+    def batch_post_metrics(self, post_ids, metrics, etags=None):
+        # Returns {post_id: (values, etag)}; values may be a GraphAPIError or NOT_MODIFIED
+        etags = etags or {}
+        query = urlencode({"fields": post_fields(metrics)}, safe=",().")
+        calls = []
+        for post_id in post_ids:
+            call = {"method": "GET", "relative_url": f"{post_id}?{query}"}
+            if etags.get(post_id):
+                call["headers"] = [f"If-None-Match: {etags[post_id]}"]
+            calls.append(call)
+        results = {}
+        for post_id, (body, etag) in zip(post_ids, self.batch(calls)):
+            if not isinstance(body, GraphAPIError) and body is not NOT_MODIFIED:
+                body = parse_post_metrics(body, metrics)
+            results[post_id] = (body, etag)
+        return results
+
+    def fetch_post_metrics(self, post_ids, metrics):
+        # {post_id: values or GraphAPIError}; one plain request for a single post, batches otherwise
+        if len(post_ids) == 1:
+            try:
+                return {post_ids[0]: self.post_metrics(post_ids[0], metrics)}
+            except GraphAPIError as e:
+                if e.throttled:
+                    raise
+                return {post_ids[0]: e}
+        return {post_id: values for post_id, (values, _) in self.batch_post_metrics(post_ids, metrics).items()}
+
+    def close(self):
+        if self._session is not None:
+            self._session.close()
@@ -0,0 +1,293 @@
+import argparse
+import collections
+import hashlib
+import json
+import random
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+# Local stand-in for the Graph API endpoints the engine uses, for tests and benchmarks
+
+STUB_TOKEN = "stub-token"
+BASE_TIME = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+INSIGHT_NAMES = ["post_engaged_users", "post_impressions_unique", "post_impressions", "post_clicks"]
+
+
+def graph_time(moment):
+    return moment.strftime("%Y-%m-%dT%H:%M:%S+0000")
+
+
+def etag_for(body):
+    return '"' + hashlib.sha1(json.dumps(body, sort_keys=True).encode()).hexdigest() + '"'
+
+
+def graph_error(message, code, status=400):
+    return status, {"error": {"message": message, "type": "OAuthException" if code == 190 else "GraphMethodException",
+                              "code": code}}
+
+
+class GraphStub:
+    def __init__(self, host="127.0.0.1", port=0, page_id="1000", posts=100, history_days=30, latency=0.0,
+                 call_limit=None, window=60.0):
+        self.page_id = page_id
+        self.posts = posts
+        self.history_days = history_days
+        self.latency = latency
+        # Simulated app rate limit: call_limit calls per window seconds
+        self.call_limit = call_limit
+        self.window = window
+        self.request_count = 0
+        self._recent = collections.deque()
+        self._lock = threading.Lock()
+
+        stub = self
+
+        class Handler(StubHandler):
+            server_stub = stub
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def count_request(self, calls=1):
+        # Returns the X-App-Usage call_count percentage, or None without a call_limit
+        with self._lock:
+            self.request_count += 1
+            if not self.call_limit:
+                return None
+            now = time.monotonic()
+            while self._recent and self._recent[0] < now - self.window:
+                self._recent.popleft()
+            used = len(self._recent) + calls
+            # Rejected calls are not charged
+            if used <= self.call_limit:
+                self._recent.extend([now] * calls)
+            return int(used * 100 / self.call_limit)
+
+    # Deterministic fake data
+
+    def post_ids(self):
+        return [f"{self.page_id}_{index + 1}" for index in range(self.posts)]
+
+    def created_time(self, post_id):
+        index = int(post_id.split("_")[-1])
+        return BASE_TIME - timedelta(hours=6 * index)
+
+    def rng(self, *key):
+        return random.Random("/".join(str(k) for k in key))
+
+    def daily_values(self, post_id, name):
+        rng = self.rng(post_id, name)
+        start = self.created_time(post_id).replace(hour=0, minute=0, second=0)
+        scale = {"post_impressions": 2000, "post_impressions_unique": 1500}.get(name, 200)
+        return [(start + timedelta(days=day + 1), int(scale * rng.random() / (day + 1)))
+                for day in range(self.history_days)]
+
+    def post(self, post_id, fields):
+        index = post_id.split("_")[-1]
+        if not post_id.startswith(f"{self.page_id}_") or not index.isdigit() or int(index) > self.posts:
+            return graph_error(f"Object with ID '{post_id}' does not exist", 100)
+        rng = self.rng(post_id)
+        body = {"id": post_id, "created_time": graph_time(self.created_time(post_id))}
+        if "shares" in fields:
+            body["shares"] = {"count": rng.randint(0, 500)}
+        for edge in ("comments", "reactions"):
+            if f"{edge}." in fields or f"{edge}," in fields:
+                body[edge] = {"data": [], "summary": {"total_count": rng.randint(0, 2000)}}
+        if "insights.metric(" in fields:
+            names = fields.split("insights.metric(", 1)[1].split(")", 1)[0].split(",")
+            body["insights"] = {"data": [self.lifetime_insight(post_id, name) for name in names]}
+        return 200, body
+
+    def lifetime_insight(self, post_id, name):
+        total = sum(value for _, value in self.daily_values(post_id, name))
+        return {"name": name, "period": "lifetime", "values": [{"value": total}], "id": f"{post_id}/insights/{name}/lifetime"}
+
+    def page_insights(self, query):
+        names = query.get("metric", [""])[0].split(",")
+        if names != ["page_fans_gender_age"]:
+            return graph_error(f"(#100) The value must be a valid insights metric: {names[0]}", 100)
+        rng = self.rng(self.page_id, "audience")
+        value = {f"{gender}.{age}": rng.randint(10, 5000)
+                 for gender in "FMU" for age in ("18-24", "25-34", "35-44", "45-54", "55-64", "65+")}
+        return 200, {"data": [{"name": "page_fans_gender_age", "period": "lifetime",
+                               "values": [{"value": value, "end_time": graph_time(BASE_TIME)}]}]}
+
+    def insights(self, post_id, query):
+        names = query.get("metric", [""])[0].split(",")
+        unknown = [name for name in names if name not in INSIGHT_NAMES]
+        if unknown:
+            return graph_error(f"(#100) The value must be a valid insights metric: {unknown[0]}", 100)
+        since = int(query.get("since", ["0"])[0])
+        until = int(query.get("until", [str(2 ** 40)])[0])
+        limit = int(query.get("limit", ["25"])[0])
+        data = []
+        last_end = None
+        for name in names:
+            points = [(end, value) for end, value in self.daily_values(post_id, name)
+                      if since < end.timestamp() <= until]
+            page = points[:limit]
+            if len(points) > limit:
+                last_end = int(page[-1][0].timestamp())
+            values = [{"value": value, "end_time": graph_time(end)} for end, value in page]
+            data.append({"name": name, "period": "day", "values": values, "id": f"{post_id}/insights/{name}/day"})
+        body = {"data": data}
+        if last_end is not None:
+            token = query["access_token"][0]
+            body["paging"] = {"next": f"{self.url}/v19.0/{post_id}/insights?metric={','.join(names)}&period=day"
+                                      f"&since={last_end}&until={until}&limit={limit}&access_token={token}"}
+        return 200, body
+
+    def page_posts(self, query):
+        limit = int(query.get("limit", ["25"])[0])
+        offset = int(query.get("after", ["0"])[0])
+        ids = self.post_ids()[offset:offset + limit]
+        body = {"data": [{"id": post_id, "created_time": graph_time(self.created_time(post_id))} for post_id in ids]}
+        if offset + limit < self.posts:
+            after = str(offset + limit)
+            token = query["access_token"][0]
+            body["paging"] = {"cursors": {"after": after},
+                              "next": f"{self.url}/v19.0/{self.page_id}/posts?limit={limit}&after={after}"
+                                      f"&access_token={token}"}
+        return 200, body
+
+    def handle(self, path, query):
+        if query.get("access_token", [""])[0] != STUB_TOKEN:
+            return graph_error("Invalid OAuth access token.", 190, 401)
+        parts = [part for part in path.split("/") if part][1:]  # drop the version
+        fields = query.get("fields", [""])[0]
+        if parts == ["me"] or parts == [self.page_id]:
+            return 200, {"id": self.page_id, "name": "Stub Page"}
+        if parts == [self.page_id, "posts"]:
+            return self.page_posts(query)
+        if parts == [self.page_id, "insights"]:
+            return self.page_insights(query)
+        if len(parts) == 1:
+            return self.post(parts[0], fields)
+        if len(parts) == 2 and parts[1] == "insights":
+            return self.insights(parts[0], query)
+        return graph_error(f"Unknown path components: /{'/'.join(parts)}", 2500, 404)
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    server_stub = None
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out in separate writes; with Nagle on, keep-alive clients wait ~40ms per request
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body, usage=None, etag=None):
+        payload = json.dumps(body).encode() if status != 304 else b""
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        if etag:
+            self.send_header("ETag", etag)
+        if usage is not None:
+            self.send_header("X-App-Usage", json.dumps({"call_count": usage, "total_time": usage // 2,
+                                                        "total_cputime": usage // 2}))
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _throttled(self, usage):
+        if usage is None or usage <= 100:
+            return False
+        self._send(*graph_error("(#4) Application request limit reached", 4, 403), usage=100)
+        return True
+
+    def do_GET(self):
+        stub = self.server_stub
+        usage = stub.count_request()
+        if stub.latency:
+            time.sleep(stub.latency)
+        if self._throttled(usage):
+            return
+        parsed = urlparse(self.path)
+        status, body = stub.handle(parsed.path, parse_qs(parsed.query))
+        etag = etag_for(body) if status == 200 else None
+        if etag and self.headers.get("If-None-Match") == etag:
+            status = 304
+        self._send(status, body, usage=usage, etag=etag)
+
+    def do_POST(self):
+        stub = self.server_stub
+        length = int(self.headers.get("Content-Length", 0))
+        form = parse_qs(self.rfile.read(length).decode())
+        token = form.get("access_token", [""])[0]
+        if "batch" not in form:
+            stub.count_request()
+            self._send(*graph_error("Unsupported post request.", 100))
+            return
+        calls = json.loads(form["batch"][0])
+        # Each call inside a batch counts against the rate limit
+        usage = stub.count_request(len(calls))
+        if stub.latency:
+            time.sleep(stub.latency)
+        if self._throttled(usage):
+            return
+        results = []
+        for call in calls:
+            relative = urlparse("/" + call["relative_url"].lstrip("/"))
+            query = parse_qs(relative.query)
+            query["access_token"] = [token]
+            status, body = stub.handle("/batch" + relative.path, query)
+            if status != 200:
+                results.append({"code": status, "headers": [], "body": json.dumps(body)})
+                continue
+            etag = etag_for(body)
+            headers = [{"name": "ETag", "value": etag}]
+            if f"If-None-Match: {etag}" in call.get("headers", []):
+                results.append({"code": 304, "headers": headers, "body": None})
+            else:
+                results.append({"code": status, "headers": headers, "body": json.dumps(body)})
+        self._send(200, results, usage=usage)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Local Graph API stand-in")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--page-id", default="1000")
+    parser.add_argument("--posts", type=int, default=100)
+    parser.add_argument("--history-days", type=int, default=30)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every request")
+    parser.add_argument("--call-limit", type=int, help="calls allowed per --window before error #4")
+    parser.add_argument("--window", type=float, default=60.0)
+    args = parser.parse_args(argv)
+    stub = GraphStub(port=args.port, page_id=args.page_id, posts=args.posts,
+                     history_days=args.history_days, latency=args.latency,
+                     call_limit=args.call_limit, window=args.window)
+    print(f"Graph API stub on {stub.url} (page {args.page_id}, token {STUB_TOKEN})")
+    try:
+        stub.server.serve_forever()
+    except KeyboardInterrupt:
+        stub.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+import logging
+import sqlite3
+import threading
+from collections import defaultdict
+from urllib.parse import urlencode
+
+import instrumentation
+from graph_api import BATCH_LIMIT, INSIGHT_METRICS, GraphAPIError
+from records import decode_insights, metric_code
+
+# Incremental insights history: only datapoints newer than each post/metric watermark are requested,
+# watermarks live in SQLite and the datapoints go to the column store
+logger = logging.getLogger("PPR")
+
+# The newest daily value is still accumulating, so it is fetched again on the next run
+LOOKBACK = 24 * 3600
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS watermarks (
+    object_id TEXT NOT NULL,
+    metric TEXT NOT NULL,
+    end_time INTEGER NOT NULL,
+    PRIMARY KEY (object_id, metric)
+);
+"""
+
+
+class SyncState:
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.executescript(SCHEMA)
+
+    def watermarks(self, object_id):
+        with self._lock:
+            rows = self.db.execute("SELECT metric, end_time FROM watermarks WHERE object_id = ?",
+                                   (object_id,)).fetchall()
+        return dict(rows)
+
+    def rows(self, object_ids=None):
+        # [(object_id, metric, end_time)], optionally only for the given objects
+        with self._lock:
+            rows = self.db.execute("SELECT object_id, metric, end_time FROM watermarks").fetchall()
+        if object_ids is not None:
+            object_ids = set(object_ids)
+            rows = [row for row in rows if row[0] in object_ids]
+        return rows
+
+    def advance(self, marks):
+        # marks: [(object_id, metric, end_time)]; watermarks never move backwards
+        with self._lock:
+            self.db.executemany("INSERT INTO watermarks VALUES (?, ?, ?) ON CONFLICT (object_id, metric) "
+                                "DO UPDATE SET end_time = MAX(end_time, excluded.end_time)", marks)
+            self.db.commit()
+
+    def close(self):
+        self.db.close()
+
+
+def iter_datapoints(client, page, call=None):
+    # Yields MetricPoints from a first page decoded with decode_insights, fetching later pages on demand;
+    # call(func, *args, **kwargs) makes the requests, e.g. Pacer.call
+    call = call or (lambda func, *args, **kwargs: func(*args, **kwargs))
+    while True:
+        found = 0
+        for item in page.get("data", []):
+            for point in item.get("values", []):
+                found += 1
+                yield point
+        next_url = page.get("paging", {}).get("next")
+        # Insights paging offers a "next" window even past the newest datapoint
+        if not next_url or not found:
+            return
+        page = call(client.get_url, next_url, decode=decode_insights)
+
+
+class IncrementalSync:
+    def __init__(self, client, state, store, metrics, page_size=90, on_rows=None, pacer=None):
+        self.client = client
+        # pacer: async_fetch.Pacer that rate-limits the requests and retries throttled ones
+        self.pacer = pacer
+        self.state = state
+        self.store = store
+        # on_rows(metric, [(post_id, end_time, value)]) sees every chunk as it is stored
+        self.on_rows = on_rows
+        self.page_size = page_size
+        self.insight_names = {INSIGHT_METRICS[m]: m for m in metrics if m in INSIGHT_METRICS}
+        self.insight_codes = {metric_code(name): metric for name, metric in self.insight_names.items()}
+        self.points_fetched = 0
+
+    def since_for(self, post_id):
+        marks = self.state.watermarks(post_id)
+        if any(metric not in marks for metric in self.insight_names.values()):
+            return None  # at least one metric has no history yet
+        return min(marks.values()) - LOOKBACK
+
+    def _first_page_call(self, post_id, since):
+        params = {"metric": ",".join(self.insight_names), "period": "day", "limit": self.page_size}
+        if since:
+            params["since"] = since
+        return {"method": "GET", "relative_url": f"{post_id}/insights?{urlencode(params, safe=',')}"}
+
+    def _call(self, func, *args, cost=1, **kwargs):
+        if self.pacer:
+            return self.pacer.call(func, *args, cost=cost, **kwargs)
+        return func(*args, **kwargs)
+
+    def sync_posts(self, post_ids, running=None):
+        # Returns {post_id: new datapoint count or GraphAPIError}; a failed request fails only its posts
+        running = running or (lambda: True)
+        results = {}
+        for start in range(0, len(post_ids), BATCH_LIMIT):
+            if not running():
+                break
+            chunk = post_ids[start:start + BATCH_LIMIT]
+            calls = [self._first_page_call(post_id, self.since_for(post_id)) for post_id in chunk]
+            rows = defaultdict(list)
+            marks = []
+            try:
+                bodies = self._call(self.client.batch, calls, decode=decode_insights, cost=len(calls))
+            except GraphAPIError as e:
+                bodies = [(e, None)] * len(chunk)
+            for post_id, (body, _) in zip(chunk, bodies):
+                if not isinstance(body, GraphAPIError):
+                    try:
+                        points = self._collect(post_id, body)
+                    except GraphAPIError as e:
+                        body = e
+                if isinstance(body, GraphAPIError):
+                    results[post_id] = body
+                    logger.error(f"History sync failed for {post_id}: {body}")
+                    continue
+                for metric, metric_points in points.items():
+                    rows[metric].extend((post_id, end_time, value) for end_time, value in metric_points)
+                    marks.append((post_id, metric, max(end_time for end_time, _ in metric_points)))
+                results[post_id] = sum(len(metric_points) for metric_points in points.values())
+
+            # Datapoints first: a crash in between re-fetches them instead of losing them
+            for metric, metric_rows in rows.items():
+                self.store.append_many(metric, metric_rows)
+                if self.on_rows:
+                    self.on_rows(metric, metric_rows)
+            self.state.advance(marks)
+            points = sum(len(metric_rows) for metric_rows in rows.values())
+            self.points_fetched += points
+            instrumentation.count("history_points", points)
+        return results
+
+    def _collect(self, post_id, first_page):
+        marks = self.state.watermarks(post_id)
+        points = defaultdict(list)
+        for point in iter_datapoints(self.client, first_page, self._call):
+            metric = self.insight_codes.get(point.metric)
+            if metric and point.time > marks.get(metric, 0) - LOOKBACK:
+                points[metric].append((point.time, point.value))
+        return points
@@ -0,0 +1,193 @@
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+# Process-wide counters and timers for the hot paths, readable as JSON or Prometheus text
+logger = logging.getLogger("PPR")
+
+PREFIX = "ppr_"
+# Histogram bucket upper bounds in seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class Timer:
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = [0] * len(BUCKETS)
+
+    def observe(self, seconds):
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        for index, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                self.buckets[index] += 1
+                break
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+def _label_text(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in pairs) + "}"
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = {}
+        self.timers = {}
+
+    def count(self, name, value=1, **labels):
+        key = _key(name, labels)
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, seconds, **labels):
+        key = _key(name, labels)
+        with self._lock:
+            timer = self.timers.get(key)
+            if timer is None:
+                timer = self.timers[key] = Timer()
+            timer.observe(seconds)
+
+    def reset(self):
+        with self._lock:
+            self.counters.clear()
+            self.timers.clear()
+
+    def snapshot(self):
+        # {"counters": {"name{label=value}": n}, "timers": {"name{...}": {count, total, mean, max}}}
+        with self._lock:
+            counters = {name + _label_text(labels): value for (name, labels), value in sorted(self.counters.items())}
+            timers = {name + _label_text(labels): {"count": timer.count, "total": round(timer.total, 6),
+                                                   "mean": round(timer.total / timer.count, 6),
+                                                   "max": round(timer.max, 6)}
+                      for (name, labels), timer in sorted(self.timers.items())}
+        return {"counters": counters, "timers": timers}
+
+    def prometheus_text(self):
+        lines = []
+        with self._lock:
+            typed = set()
+            for (name, labels), value in sorted(self.counters.items()):
+                if name not in typed:
+                    typed.add(name)
+                    lines.append(f"# TYPE {PREFIX}{name}_total counter")
+                lines.append(f"{PREFIX}{name}_total{_label_text(labels)} {value}")
+            for (name, labels), timer in sorted(self.timers.items()):
+                if name not in typed:
+                    typed.add(name)
+                    lines.append(f"# TYPE {PREFIX}{name} histogram")
+                cumulative = 0
+                for bound, count in zip(BUCKETS, timer.buckets):
+                    cumulative += count
+                    lines.append(f"{PREFIX}{name}_bucket{_label_text(labels, [('le', bound)])} {cumulative}")
+                lines.append(f"{PREFIX}{name}_bucket{_label_text(labels, [('le', '+Inf')])} {timer.count}")
+                lines.append(f"{PREFIX}{name}_sum{_label_text(labels)} {timer.total}")
+                lines.append(f"{PREFIX}{name}_count{_label_text(labels)} {timer.count}")
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+
+def count(name, value=1, **labels):
+    registry.count(name, value, **labels)
+
+
+def observe(name, seconds, **labels):
+    registry.observe(name, seconds, **labels)
+
+
+@contextmanager
+def timed(name, **labels):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        registry.observe(name, time.perf_counter() - start, **labels)
+
+
+def write_json(path):
+    with open(path, 'w') as f:
+        json.dump(registry.snapshot(), f, indent=4)
+
+
+def metrics_response(path):
+    # (body, content type) for a metrics endpoint path, or None
+    if path.split("?")[0] == "/metrics":
+        return registry.prometheus_text().encode(), "text/plain; version=0.0.4"
+    if path.split("?")[0] == "/metrics.json":
+        return json.dumps(registry.snapshot()).encode(), "application/json"
+    return None
+
+
+def serve(port, host="127.0.0.1"):
+    # Prometheus text on /metrics and JSON on /metrics.json, from a daemon thread.
+    # The HTTP server is only imported when the endpoint is enabled.
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            response = metrics_response(self.path)
+            if response is None:
+                self.send_error(404)
+                return
+            body, content_type = response
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    logger.info(f"Serving metrics on http://{host}:{server.server_address[1]}/metrics")
+    return server
+
+
+@contextmanager
+def profiled(job, directory=None):
+    # Opt-in: cProfile stats (<job>-<time>.prof) and the top allocations (<job>-<time>.memory.txt).
+    # cProfile only sees the calling thread; worker threads and processes are not included.
+    if not directory:
+        yield
+        return
+    import cProfile
+    import tracemalloc
+
+    os.makedirs(directory, exist_ok=True)
+    base = os.path.join(directory, f"{job}-{datetime.now().strftime('%Y%m%d_%H%M%S')}")
+    tracing = not tracemalloc.is_tracing()
+    if tracing:
+        tracemalloc.start()
+    profile = cProfile.Profile()
+    profile.enable()
+    try:
+        yield
+    finally:
+        profile.disable()
+        profile.dump_stats(base + ".prof")
+        current, peak = tracemalloc.get_traced_memory()
+        top = tracemalloc.take_snapshot().statistics("lineno")[:25]
+        if tracing:
+            tracemalloc.stop()
+        with open(base + ".memory.txt", 'w') as f:
+            f.write(f"current {current / 1024:.0f} KB, peak {peak / 1024:.0f} KB\n")
+            f.writelines(f"{stat}\n" for stat in top)
+        logger.info(f"Profile of {job} written to {base}.prof")
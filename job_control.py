@@ -0,0 +1,112 @@
+import json
+import logging
+import os
+import threading
+import time
+
+# Pause / resume / cancel for long jobs, and on-disk checkpoints so they can resume after a stop or crash
+logger = logging.getLogger("PPR")
+
+
+class JobControl:
+    def __init__(self):
+        self._resume = threading.Event()
+        self._resume.set()
+        self._cancel = threading.Event()
+        self._callbacks = []
+        self._lock = threading.Lock()
+
+    @property
+    def paused(self):
+        return not self._resume.is_set()
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    def pause(self):
+        if not self.cancelled:
+            self._resume.clear()
+
+    def resume(self):
+        self._resume.set()
+
+    def cancel(self):
+        self._cancel.set()
+        self._resume.set()  # wake anything blocked in a pause
+        with self._lock:
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback()
+
+    def on_cancel(self, callback):
+        # callback() runs once, from the thread that cancels; immediately if already cancelled
+        with self._lock:
+            if not self.cancelled:
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def __call__(self):
+        # Usable wherever the engine takes a running() callable: blocks while paused
+        self._resume.wait()
+        return not self.cancelled
+
+    def wait(self, timeout=None):
+        # True once cancelled; for jobs that run until stopped
+        return self._cancel.wait(timeout)
+
+
+class Checkpoint:
+    def __init__(self, data_dir, job, key, max_age=None):
+        # key identifies what is being processed (e.g. the page id); a checkpoint for another key is ignored,
+        # as is one last saved more than max_age seconds ago
+        self.path = os.path.join(data_dir, "checkpoints", f"{job}.json")
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self.key = key
+        self.max_age = max_age
+        self.completed = set()
+        self.cursor = None
+        self.resumed = False
+        self._lock = threading.Lock()
+        self.load()
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r') as f:
+                state = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable checkpoint {self.path}: {e}")
+            return
+        if state.get("key") != self.key:
+            return
+        age = time.time() - state.get("updated", 0)
+        if self.max_age is not None and age > self.max_age:
+            logger.info(f"Ignoring checkpoint {self.path} saved {age:.0f}s ago")
+            return
+        self.completed = set(state.get("completed", []))
+        self.cursor = state.get("cursor")
+        self.resumed = bool(self.completed or self.cursor)
+
+    def save(self):
+        with self._lock:
+            state = {"key": self.key, "cursor": self.cursor, "completed": sorted(self.completed),
+                     "updated": time.time()}
+            with open(self.path + ".tmp", 'w') as f:
+                json.dump(state, f)
+            os.replace(self.path + ".tmp", self.path)
+
+    def mark(self, items, cursor=None):
+        with self._lock:
+            self.completed.update(items)
+            if cursor is not None:
+                self.cursor = cursor
+        self.save()
+
+    def clear(self):
+        self.completed = set()
+        self.cursor = None
+        if os.path.exists(self.path):
+            os.remove(self.path)
@@ -0,0 +1,213 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+from itertools import groupby
+
+import instrumentation
+from graph_api import NOT_MODIFIED, GraphAPIError
+
+# On-disk metrics cache keyed by (object id, metric, period), with per-metric TTL,
+# ETag revalidation and LRU eviction under a size cap
+logger = logging.getLogger("PPR")
+
+DEFAULT_TTL = {
+    "engagement": 900,
+    "reach": 900,
+    "impressions": 900,
+    "clicks": 900,
+    "shares": 300,
+    "comments": 300,
+    "reactions": 300,
+}
+ROW_OVERHEAD = 64  # rough bytes per row besides value and etag
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS metrics (
+    object_id TEXT NOT NULL,
+    metric TEXT NOT NULL,
+    period TEXT NOT NULL,
+    value TEXT NOT NULL,
+    etag TEXT,
+    request_key TEXT,
+    fetched_at REAL NOT NULL,
+    expires_at REAL NOT NULL,
+    last_access REAL NOT NULL,
+    size INTEGER NOT NULL,
+    PRIMARY KEY (object_id, metric, period)
+);
+CREATE INDEX IF NOT EXISTS metrics_lru ON metrics (last_access);
+"""
+
+
+class CacheEntry:
+    def __init__(self, value, etag, request_key, expires_at):
+        self.value = value
+        self.etag = etag
+        self.request_key = request_key
+        self.expires_at = expires_at
+
+    @property
+    def fresh(self):
+        return time.time() < self.expires_at
+
+
+class MetricsCache:
+    def __init__(self, path, max_bytes=64 * 1024 * 1024, ttl=None, default_ttl=900):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttl = dict(DEFAULT_TTL)
+        self.ttl.update(ttl or {})
+        self.default_ttl = default_ttl
+        self.hits = 0
+        self.misses = 0
+        self.revalidated = 0
+
+        # Shared by the engine thread and the async fetcher's worker threads
+        self._lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.executescript(SCHEMA)
+        self.size = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM metrics").fetchone()[0]
+
+    def ttl_for(self, metric):
+        return self.ttl.get(metric, self.default_ttl)
+
+    def lookup(self, object_id, metrics, period="lifetime"):
+        with self._lock:
+            placeholders = ",".join("?" * len(metrics))
+            rows = self.db.execute(
+                f"SELECT metric, value, etag, request_key, expires_at FROM metrics "
+                f"WHERE object_id = ? AND period = ? AND metric IN ({placeholders})",
+                [object_id, period, *metrics]).fetchall()
+            if rows:
+                self.db.execute(
+                    f"UPDATE metrics SET last_access = ? WHERE object_id = ? AND period = ? "
+                    f"AND metric IN ({placeholders})", [time.time(), object_id, period, *metrics])
+                self.db.commit()
+        return {metric: CacheEntry(json.loads(value), etag, request_key, expires_at)
+                for metric, value, etag, request_key, expires_at in rows}
+
+    def put(self, object_id, values, period="lifetime", etag=None):
+        now = time.time()
+        request_key = ",".join(sorted(values))
+        with self._lock:
+            for metric, value in values.items():
+                encoded = json.dumps(value)
+                size = len(encoded) + len(etag or "") + len(object_id) + len(metric) + ROW_OVERHEAD
+                old = self.db.execute("SELECT size FROM metrics WHERE object_id = ? AND metric = ? AND period = ?",
+                                      (object_id, metric, period)).fetchone()
+                self.db.execute(
+                    "INSERT OR REPLACE INTO metrics VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (object_id, metric, period, encoded, etag, request_key, now,
+                     now + self.ttl_for(metric), now, size))
+                self.size += size - (old[0] if old else 0)
+            self.db.commit()
+            if self.size > self.max_bytes:
+                self._evict()
+
+    def touch(self, object_id, metrics, period="lifetime"):
+        # The server confirmed the cached values (HTTP 304): start a new TTL
+        now = time.time()
+        with self._lock:
+            for metric in metrics:
+                self.db.execute("UPDATE metrics SET expires_at = ?, last_access = ? "
+                                "WHERE object_id = ? AND metric = ? AND period = ?",
+                                (now + self.ttl_for(metric), now, object_id, metric, period))
+            self.db.commit()
+
+    def _evict(self):
+        # Drop least recently used rows until we are 10% under the cap
+        target = int(self.max_bytes * 0.9)
+        evicted = 0
+        while self.size > target:
+            rows = self.db.execute("SELECT object_id, metric, period, size FROM metrics "
+                                   "ORDER BY last_access LIMIT 500").fetchall()
+            if not rows:
+                self.size = 0
+                break
+            for object_id, metric, period, size in rows:
+                if self.size <= target:
+                    break
+                self.db.execute("DELETE FROM metrics WHERE object_id = ? AND metric = ? AND period = ?",
+                                (object_id, metric, period))
+                self.size -= size
+                evicted += 1
+        self.db.commit()
+        logger.info(f"Metrics cache evicted {evicted} entries ({self.size} bytes kept)")
+
+    def clear(self):
+        with self._lock:
+            self.db.execute("DELETE FROM metrics")
+            self.db.commit()
+            self.size = 0
+
+    def close(self):
+        self.db.close()
+
+    def fresh_values(self, post_ids, metrics):
+        # {post_id: values} for the posts whose metrics are all fresh, i.e. that need no request
+        results = {}
+        for post_id in post_ids:
+            entries = self.lookup(post_id, metrics)
+            if all(metric in entries and entries[metric].fresh for metric in metrics):
+                self.hits += 1
+                instrumentation.count("cache_hits")
+                results[post_id] = {metric: entries[metric].value for metric in metrics}
+        return results
+
+    def fetch_post_metrics(self, client, post_ids, metrics):
+        # Same contract as GraphAPIClient.fetch_post_metrics, but only stale metrics hit the network
+        results = {}
+        stale = {}
+        for post_id in post_ids:
+            entries = self.lookup(post_id, metrics)
+            fresh = {metric: entries[metric].value for metric in metrics
+                     if metric in entries and entries[metric].fresh}
+            if len(fresh) == len(metrics):
+                self.hits += 1
+                instrumentation.count("cache_hits")
+                results[post_id] = fresh
+                continue
+            self.misses += 1
+            instrumentation.count("cache_misses")
+            results[post_id] = fresh
+            missing = tuple(metric for metric in metrics if metric not in fresh)
+            # The etag only applies to a request for exactly the same metric set
+            etag = None
+            if all(metric in entries for metric in missing):
+                etags = {entries[metric].etag for metric in missing}
+                keys = {entries[metric].request_key for metric in missing}
+                if len(etags) == 1 and keys == {",".join(sorted(missing))}:
+                    etag = etags.pop()
+            stale[post_id] = (missing, etag, entries)
+
+        # One request (or batch) per distinct set of stale metrics
+        by_metrics = sorted(stale.items(), key=lambda item: item[1][0])
+        for missing, group in groupby(by_metrics, key=lambda item: item[1][0]):
+            group = list(group)
+            ids = [post_id for post_id, _ in group]
+            etags = {post_id: etag for post_id, (_, etag, _) in group}
+            if len(ids) == 1:
+                try:
+                    fetched = {ids[0]: client.post_metrics_conditional(ids[0], list(missing), etags[ids[0]])}
+                except GraphAPIError as e:
+                    if e.throttled:
+                        raise
+                    fetched = {ids[0]: (e, None)}
+            else:
+                fetched = client.batch_post_metrics(ids, list(missing), etags)
+
+            for post_id, (values, etag) in fetched.items():
+                entries = stale[post_id][2]
+                if isinstance(values, GraphAPIError):
+                    results[post_id] = values
+                elif values is NOT_MODIFIED:
+                    self.revalidated += 1
+                    instrumentation.count("cache_revalidated")
+                    self.touch(post_id, missing)
+                    results[post_id].update({metric: entries[metric].value for metric in missing})
+                else:
+                    self.put(post_id, values, etag=etag)
+                    results[post_id].update(values)
+        return results
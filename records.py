@@ -0,0 +1,69 @@
+import json
+import sys
+import threading
+from dataclasses import dataclass
+
+from graph_api import parse_time
+
+# Compact in-memory records. Metric names are interned into small integer codes and post ids into
+# shared strings, so a record costs a fixed few dozen bytes instead of a dict per datapoint.
+
+METRIC_NAMES = []
+METRIC_CODES = {}
+_intern_lock = threading.Lock()
+
+
+def metric_code(name):
+    code = METRIC_CODES.get(name)
+    if code is None:
+        with _intern_lock:
+            code = METRIC_CODES.get(name)
+            if code is None:
+                # Name first, so a lock-free reader never sees a code without it
+                METRIC_NAMES.append(sys.intern(name))
+                code = METRIC_CODES[name] = len(METRIC_NAMES) - 1
+    return code
+
+
+@dataclass(slots=True)
+class MetricPoint:
+    post_id: str
+    metric: int
+    time: int
+    value: float
+
+    @property
+    def name(self):
+        return METRIC_NAMES[self.metric]
+
+
+@dataclass(slots=True)
+class ReportSection:
+    title: str
+    lines: list
+    seconds: float = 0.0
+
+
+def _insights_object(pairs):
+    # object_pairs_hook: datapoints become MetricPoints as they are parsed; the insight item that
+    # holds them (parsed after its values) fills in their metric and post
+    if len(pairs) == 2:
+        (first, first_value), (second, second_value) = pairs
+        if first == "value" and second == "end_time":
+            return MetricPoint("", -1, parse_time(second_value), first_value)
+        if first == "end_time" and second == "value":
+            return MetricPoint("", -1, parse_time(first_value), second_value)
+    item = dict(pairs)
+    if "name" in item and isinstance(item.get("values"), list):
+        code = metric_code(item["name"])
+        post_id = sys.intern(str(item.get("id", "")).split("/", 1)[0])
+        for point in item["values"]:
+            if isinstance(point, MetricPoint):
+                point.metric = code
+                point.post_id = post_id
+    return item
+
+
+def decode_insights(text):
+    # json.loads for insights responses: {"data": [{"name", "values": [MetricPoint, ...]}], "paging"}
+    return json.loads(text, object_pairs_hook=_insights_object)
@@ -0,0 +1,148 @@
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+import instrumentation
+from column_store import engagement_rate, growth
+from records import ReportSection
+
+# Report sections are plain functions that declare the inputs they need. The builder loads every
+# input once and runs the sections on threads; they only reduce per-post totals and rollups, too
+# little work to be worth shipping the inputs to other processes.
+logger = logging.getLogger("PPR")
+
+WEEKDAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+AGE_GROUPS = ["13-17", "18-24", "25-34", "35-44", "45-54", "55-64", "65+"]
+
+SECTIONS = []
+
+
+class Section:
+    def __init__(self, title, func, needs):
+        self.title = title
+        self.func = func
+        self.needs = needs
+
+
+def section(title, needs=()):
+    # Registers a section; sections appear in the report in registration order
+    def register(func):
+        SECTIONS.append(Section(title, func, tuple(needs)))
+        return func
+    return register
+
+
+def run_section(func, inputs):
+    # Timed where it runs, reported by the builder
+    start = time.perf_counter()
+    lines = func(inputs)
+    return lines, time.perf_counter() - start
+
+
+class ReportBuilder:
+    def __init__(self, load_input, sections=None, workers=None):
+        # load_input(name) -> value, called once per distinct input name
+        self.load_input = load_input
+        self.sections = list(SECTIONS if sections is None else sections)
+        self.workers = workers
+
+    def build(self, running=None):
+        # Yields ReportSections in report order; each section starts as soon as the inputs are loaded
+        running = running or (lambda: True)
+        names = sorted({name for item in self.sections for name in item.needs})
+        with ThreadPoolExecutor(max_workers=self.workers) as threads:
+            with instrumentation.timed("report_inputs_seconds"):
+                loading = {name: threads.submit(self.load_input, name) for name in names}
+                inputs = {name: future.result() for name, future in loading.items()}
+
+            futures = [threads.submit(run_section, item.func, {name: inputs[name] for name in item.needs})
+                       for item in self.sections]
+            for item, future in zip(self.sections, futures):
+                if not running():
+                    for pending in futures:
+                        pending.cancel()
+                    return
+                try:
+                    lines, seconds = future.result()
+                    instrumentation.observe("report_section_seconds", seconds, section=item.func.__name__)
+                except Exception as e:
+                    logger.error(f"Report section {item.title} failed: {str(e)}")
+                    lines, seconds = [f"Could not build this section: {e}"], 0.0
+                yield ReportSection(item.title, lines, seconds)
+
+
+# Built-in sections. Inputs: "post_ids", "totals:<metric>" (lifetime total per post), "audience"
+# (page fans by gender/age), and from the rollups: "rollup:<grain>:<column>" (day/week/hour buckets as (starts, totals), post_hour and
+# post_weekday as dense arrays) and "top:<metric>" ([(post_id, lifetime value, reach)], best first).
+
+@section("Engagement Overview", needs=("post_ids", "totals:engagement", "totals:reach"))
+def engagement_overview(inputs):
+    if not inputs["post_ids"]:
+        return ["No data yet, run sync first"]
+    engagement = inputs["totals:engagement"]
+    overall, _ = engagement_rate(engagement, inputs["totals:reach"])
+    return [f"Posts: {len(inputs['post_ids'])}",
+            f"Total Engagement: {int(engagement.sum())}",
+            f"Engagement Rate: {overall:.2f}%"]
+
+
+@section("Audience Demographics", needs=("audience",))
+def audience_demographics(inputs):
+    audience = inputs["audience"]
+    if not audience:
+        return ["No audience data available for this page"]
+    total = sum(audience.values())
+    by_age = {group: 0 for group in AGE_GROUPS}
+    for key, count in audience.items():
+        group = key.split(".", 1)[-1]
+        if group in by_age:
+            by_age[group] += count
+    return [f"Age {group}: {count / total * 100:.0f}%" for group, count in by_age.items() if count]
+
+
+@section("Peak Activity Times", needs=("rollup:post_hour:engagement.lifetime",
+                                       "rollup:post_weekday:engagement.lifetime"))
+def peak_activity_times(inputs):
+    by_hour = inputs["rollup:post_hour:engagement.lifetime"]
+    by_weekday = inputs["rollup:post_weekday:engagement.lifetime"]
+    if not by_hour.any():
+        return ["No posting times recorded yet"]
+    hours = np.argsort(by_hour)[::-1][:3]
+    return [f"Best posting hours (UTC): {', '.join(f'{h:02d}:00' for h in hours)}",
+            f"Best day: {WEEKDAYS[int(np.argmax(by_weekday))]}"]
+
+
+@section("Top Performing Content", needs=("top:engagement",))
+def top_performing_content(inputs, count=5):
+    top = [row for row in inputs["top:engagement"][:count] if row[1] > 0]
+    if not top:
+        return ["No engagement recorded yet"]
+    return [f"{rank}. {post_id}: {int(engagement)} engagements "
+            f"({engagement / reach * 100 if reach > 0 else 0.0:.2f}% rate)"
+            for rank, (post_id, engagement, reach) in enumerate(top, 1)]
+
+
+@section("Growth Metrics", needs=("rollup:day:engagement", "rollup:day:impressions"))
+def growth_metrics(inputs):
+    lines = []
+    for metric in ("engagement", "impressions"):
+        current, previous, change = growth(*inputs[f"rollup:day:{metric}"])
+        trend = f"{change:+.1f}%" if change is not None else "n/a"
+        lines.append(f"{metric.capitalize()} last 7 days: {int(current)} ({trend} vs previous 7 days)")
+    return lines
+
+
+@section("Recommendations", needs=("rollup:post_hour:engagement.lifetime", "rollup:day:engagement"))
+def recommendations(inputs):
+    lines = []
+    by_hour = inputs["rollup:post_hour:engagement.lifetime"]
+    if by_hour.any():
+        lines.append(f"Schedule posts around {int(np.argmax(by_hour)):02d}:00 UTC, the best performing hour")
+    _, _, change = growth(*inputs["rollup:day:engagement"])
+    if change is not None and change < 0:
+        lines.append("Engagement is falling week over week: review recent content formats")
+    elif change is not None:
+        lines.append("Engagement is growing: keep the current posting mix")
+    return lines or ["Not enough data for recommendations yet, run sync --history"]
@@ -0,0 +1,292 @@
+import heapq
+import logging
+import sqlite3
+import threading
+
+import numpy as np
+
+from column_store import DAY, bucket_totals, hour_of_day, latest_rows, weekday
+
+# Rollups maintained as rows are written to the column store, so report sections read a few
+# precomputed rows instead of scanning every datapoint. Daily series roll up by their own time
+# (hour/day/week); lifetime totals by the posting time of their post, with a top-N index per metric.
+logger = logging.getLogger("PPR")
+
+WEEK = 7 * DAY
+# grain -> (bucket size, offset of the bucket edges); weeks start on Monday
+TIME_GRAINS = {"hour": (3600, 0), "day": (DAY, 0), "week": (WEEK, 3 * DAY)}
+POSTING_GRAINS = {"post_hour": (hour_of_day, 24), "post_weekday": (weekday, 7)}
+LIFETIME_SUFFIX = ".lifetime"
+TOP_SIZE = 20
+# Bumped when the tables change; older tables are dropped and rebuilt from the store
+SCHEMA_VERSION = 1
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS rollups (
+    metric TEXT NOT NULL,
+    grain TEXT NOT NULL,
+    bucket INTEGER NOT NULL,
+    value REAL NOT NULL,
+    PRIMARY KEY (metric, grain, bucket)
+);
+CREATE TABLE IF NOT EXISTS latest (
+    metric TEXT NOT NULL,
+    post_id TEXT NOT NULL,
+    time INTEGER NOT NULL,
+    value REAL NOT NULL,
+    created INTEGER NOT NULL DEFAULT 0,  -- posting time the value was folded under, 0 if unknown
+    PRIMARY KEY (metric, post_id)
+);
+CREATE TABLE IF NOT EXISTS top_posts (
+    metric TEXT NOT NULL,
+    post_id TEXT NOT NULL,
+    value REAL NOT NULL,
+    PRIMARY KEY (metric, post_id)
+);
+CREATE TABLE IF NOT EXISTS folded (
+    metric TEXT PRIMARY KEY,
+    rows INTEGER NOT NULL
+);
+"""
+
+
+class TopN:
+    # Min-heap of the `size` largest (value, post_id) pairs
+    def __init__(self, size, items=()):
+        self.size = size
+        self.values = dict(items)
+        self._heapify()
+
+    def _heapify(self):
+        self.heap = [(value, post_id) for post_id, value in self.values.items()]
+        heapq.heapify(self.heap)
+
+    def offer(self, post_id, value):
+        # False when a member dropped: a post outside the heap may now rank higher, so rebuild it
+        if post_id in self.values:
+            dropped = value < self.values[post_id]
+            self.values[post_id] = value
+            self._heapify()
+            return not dropped
+        if len(self.heap) < self.size:
+            heapq.heappush(self.heap, (value, post_id))
+            self.values[post_id] = value
+        elif (value, post_id) > self.heap[0]:
+            _, evicted = heapq.heapreplace(self.heap, (value, post_id))
+            del self.values[evicted]
+            self.values[post_id] = value
+        return True
+
+
+def _group_ends(codes):
+    # Index one past the last row of each post in rows sorted by post
+    ends = np.flatnonzero(codes[1:] != codes[:-1]) + 1
+    return np.append(ends, len(codes))
+
+
+class Rollups:
+    def __init__(self, path, top_size=TOP_SIZE):
+        self.path = path
+        self.top_size = top_size
+        # Writes come from the store's writers, reads from report threads
+        self._lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        # Everything here can be rebuilt from the store, so commits need not wait for the disk
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        if self.db.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+            for table in ("rollups", "latest", "top_posts", "folded"):
+                self.db.execute(f"DROP TABLE IF EXISTS {table}")
+            self.db.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        self.db.executescript(SCHEMA)
+
+    def attach(self, store):
+        store.listeners.append(self.ingest)
+
+    # Incremental maintenance
+
+    def ingest(self, store, metric, codes, times, values):
+        # Store listener. Re-written rows replace earlier ones: each post's newest (time, value) is kept,
+        # so a re-fetched newest point adds only its change. An older point re-written (a --full sync,
+        # or a revision beyond the sync lookback) adds its change against the value stored before.
+        rows = len(values)
+        if not rows:
+            return
+        keep = latest_rows(codes, times)
+        codes, times, values = codes[keep], times[keep], values[keep]
+        ends = _group_ends(codes)
+        last = ends - 1
+        post_ids = [store.post_ids[code] for code in codes[last].tolist()]
+        try:
+            with self._lock:
+                self.db.execute("BEGIN IMMEDIATE")
+                try:
+                    prior = self._latest(metric, post_ids)
+                    prior = [prior.get(post_id, (-1, 0.0, 0)) for post_id in post_ids]
+                    prior_time = np.array([row[0] for row in prior], dtype=np.int64)
+                    prior_value = np.array([row[1] for row in prior])
+                    # Posts whose newest row is at least as new as what was folded in before
+                    newer = np.flatnonzero(times[last] >= prior_time)
+                    lifetime = metric.endswith(LIFETIME_SUFFIX)
+                    created = np.array([store.created[code] or 0 for code in codes[last][newer].tolist()] if lifetime
+                                       else np.zeros(len(newer)), dtype=np.int64)
+                    updates = list(zip([metric] * len(newer), [post_ids[index] for index in newer.tolist()],
+                                       times[last][newer].tolist(), values[last][newer].tolist(), created.tolist()))
+                    if lifetime:
+                        prior_created = np.array([prior[index][2] for index in newer.tolist()], dtype=np.int64)
+                        self._fold_lifetime(metric, updates, created, values[last][newer], prior_created,
+                                            prior_value[newer])
+                    else:
+                        counts = np.diff(ends, prepend=0)
+                        row_time, row_value = np.repeat(prior_time, counts), np.repeat(prior_value, counts)
+                        changes = np.where(times == row_time, values - row_value, values)
+                        older = np.flatnonzero(times < row_time)
+                        if len(older):
+                            previous = store.previous_values(metric, codes[older], times[older],
+                                                             store.row_count(metric) - rows)
+                            changes[older] -= np.nan_to_num(previous)
+                        for grain, (size, offset) in TIME_GRAINS.items():
+                            self._add(metric, grain, *bucket_totals(times, changes, size, offset))
+                    self._set_latest(updates)
+                    self.db.execute("INSERT INTO folded VALUES (?, ?) ON CONFLICT (metric) "
+                                    "DO UPDATE SET rows = rows + excluded.rows", (metric, rows))
+                    self.db.execute("COMMIT")
+                except BaseException:
+                    self.db.execute("ROLLBACK")
+                    raise
+        except sqlite3.Error as e:
+            # The row counts no longer match, so the next refresh() rebuilds this metric
+            logger.warning(f"Rollup update for {metric} failed: {str(e)}")
+
+    def _latest(self, metric, post_ids):
+        # {post_id: (time, value, created)}
+        prior = {}
+        for start in range(0, len(post_ids), 500):
+            chunk = post_ids[start:start + 500]
+            prior.update((post_id, (time, value, created)) for post_id, time, value, created in self.db.execute(
+                f"SELECT post_id, time, value, created FROM latest "
+                f"WHERE metric = ? AND post_id IN ({','.join('?' * len(chunk))})", [metric] + chunk))
+        return prior
+
+    def _set_latest(self, updates):
+        self.db.executemany("INSERT INTO latest VALUES (?, ?, ?, ?, ?) ON CONFLICT (metric, post_id) DO UPDATE "
+                            "SET time = excluded.time, value = excluded.value, created = excluded.created", updates)
+
+    def _fold_posting(self, metric, created, values):
+        for grain, (bucket, size) in POSTING_GRAINS.items():
+            slots = bucket(created)
+            totals = np.bincount(slots, weights=values, minlength=size)
+            used = np.flatnonzero(np.bincount(slots, minlength=size))
+            self._add(metric, grain, used, totals[used])
+
+    def _fold_lifetime(self, metric, updates, created, values, prior_created, prior_values):
+        # Caller holds the lock inside a transaction. A post's previous total leaves the slot of the
+        # posting time it was folded under and the new total enters the slot of its current one, so a
+        # post whose posting time became known since (analyze, then sync) moves in whole.
+        was_known, known = prior_created > 0, created > 0
+        self._fold_posting(metric, np.concatenate([prior_created[was_known], created[known]]),
+                           np.concatenate([-prior_values[was_known], values[known]]))
+
+        top = TopN(self.top_size, self.db.execute("SELECT post_id, value FROM top_posts WHERE metric = ?", (metric,)))
+        before = dict(top.values)
+        complete = all([top.offer(post_id, value) for _, post_id, _, value, _ in updates])
+        if not complete:
+            self._set_latest(updates)
+            top = TopN(self.top_size, self.db.execute(
+                "SELECT post_id, value FROM latest WHERE metric = ? ORDER BY value DESC LIMIT ?", (metric, self.top_size)))
+        if top.values != before:
+            self.db.execute("DELETE FROM top_posts WHERE metric = ?", (metric,))
+            self.db.executemany("INSERT INTO top_posts VALUES (?, ?, ?)",
+                                [(metric, post_id, value) for post_id, value in top.values.items()])
+
+    def _add(self, metric, grain, buckets, totals):
+        self.db.executemany("INSERT INTO rollups VALUES (?, ?, ?, ?) ON CONFLICT (metric, grain, bucket) "
+                            "DO UPDATE SET value = value + excluded.value",
+                            [(metric, grain, int(bucket), float(total)) for bucket, total in zip(buckets, totals)])
+
+    # Rebuilds
+
+    def refresh(self, store):
+        # Rebuilds the metrics whose folded row count does not match the store: data written before
+        # the rollups existed, by a store without this listener, or lost to a failed update or compact().
+        # Also lifetime metrics with a post whose posting time was set after its total was folded.
+        with self._lock:
+            folded = dict(self.db.execute("SELECT metric, rows FROM folded"))
+            posting = self.db.execute("SELECT metric, post_id, created FROM latest WHERE metric LIKE ?",
+                                      ("%" + LIFETIME_SUFFIX,)).fetchall()
+        moved = {metric for metric, post_id, created in posting
+                 if post_id in store.codes and (store.created[store.codes[post_id]] or 0) != created}
+        rebuilt = []
+        for metric in set(store.metrics()) | set(folded):
+            if metric in moved or folded.get(metric) != store.row_count(metric):
+                self.rebuild(store, metric)
+                rebuilt.append(metric)
+        return rebuilt
+
+    def rebuild(self, store, metric):
+        rows = store.row_count(metric)
+        column = store.column(metric)
+        ends = _group_ends(column.post) if len(column) else np.empty(0, dtype=np.int64)
+        codes = column.post[ends - 1]
+        lifetime = metric.endswith(LIFETIME_SUFFIX)
+        created = store.created_times()[codes] if lifetime and len(codes) else np.zeros(len(codes), dtype=np.int64)
+        latest = [(metric, store.post_ids[code], int(time), float(value), int(posted)) for code, time, value, posted
+                  in zip(codes, column.time[ends - 1], column.value[ends - 1], created)]
+        with self._lock:
+            self.db.execute("BEGIN IMMEDIATE")
+            try:
+                for table in ("rollups", "latest", "top_posts", "folded"):
+                    self.db.execute(f"DELETE FROM {table} WHERE metric = ?", (metric,))
+                self.db.executemany("INSERT INTO latest VALUES (?, ?, ?, ?, ?)", latest)
+                if lifetime:
+                    known = created > 0
+                    self._fold_posting(metric, created[known], column.value[ends - 1][known])
+                    self.db.execute("INSERT INTO top_posts SELECT metric, post_id, value FROM latest "
+                                    "WHERE metric = ? ORDER BY value DESC LIMIT ?", (metric, self.top_size))
+                else:
+                    for grain, (size, offset) in TIME_GRAINS.items():
+                        self._add(metric, grain, *bucket_totals(column.time, column.value, size, offset))
+                self.db.execute("INSERT INTO folded VALUES (?, ?)", (metric, rows))
+                self.db.execute("COMMIT")
+            except BaseException:
+                self.db.execute("ROLLBACK")
+                raise
+        logger.info(f"Rebuilt rollups for {metric} from {len(column)} rows")
+
+    # Reads
+
+    def buckets(self, metric, grain):
+        # (bucket keys, totals) in bucket order: start times for time grains, hour/weekday numbers otherwise
+        with self._lock:
+            rows = self.db.execute("SELECT bucket, value FROM rollups WHERE metric = ? AND grain = ? ORDER BY bucket",
+                                   (metric, grain)).fetchall()
+        return np.array([row[0] for row in rows], dtype=np.int64), np.array([row[1] for row in rows], dtype=np.float64)
+
+    def slots(self, metric, grain):
+        # Dense totals for a posting grain: 24 hours or 7 weekdays
+        bucket, size = POSTING_GRAINS[grain]
+        keys, totals = self.buckets(metric, grain)
+        dense = np.zeros(size, dtype=np.float64)
+        dense[keys] = totals
+        return dense
+
+    def top(self, metric, count=None):
+        # [(post_id, value)], largest first
+        with self._lock:
+            rows = self.db.execute("SELECT post_id, value FROM top_posts WHERE metric = ? "
+                                   "ORDER BY value DESC, post_id DESC LIMIT ?", (metric, count or self.top_size)).fetchall()
+        return rows
+
+    def folded_rows(self, metric):
+        # Store rows folded in so far; matches store.row_count() while the rollups are current
+        with self._lock:
+            row = self.db.execute("SELECT rows FROM folded WHERE metric = ?", (metric,)).fetchone()
+        return row[0] if row else 0
+
+    def latest(self, metric, post_ids):
+        # {post_id: newest value}
+        with self._lock:
+            return {post_id: value for post_id, (_, value, _) in self._latest(metric, list(post_ids)).items()}
+
+    def close(self):
+        self.db.close()
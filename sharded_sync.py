@@ -0,0 +1,196 @@
+import logging
+import multiprocessing
+import os
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from column_store import ColumnStore, lifetime
+from graph_api import BATCH_LIMIT, GraphAPIClient, GraphAPIError
+from incremental_sync import IncrementalSync, SyncState
+from job_control import JobControl
+
+# Sharded page sync: the page's posts are split by date or id range across worker processes.
+# Each worker fetches into its own column store segment; the parent merges the segments.
+logger = logging.getLogger("PPR")
+
+SHARD_KEYS = ("date", "id")
+
+# Set in each worker process by _init_worker; the parent sets it to stop every shard
+_stop = None
+
+
+def split_posts(posts, shards, by="date"):
+    # posts: [(post_id, created_time)] -> up to `shards` contiguous ranges of about equal size
+    if by == "date":
+        ordered = sorted(posts, key=lambda post: (post[1] or 0, post[0]))
+    elif by == "id":
+        ordered = sorted(posts, key=lambda post: [int(part) if part.isdigit() else part
+                                                  for part in post[0].split("_")])
+    else:
+        raise ValueError(f"Unknown shard key: {by}")
+    shards = max(1, min(shards, len(ordered)))
+    size, extra = divmod(len(ordered), shards)
+    ranges = []
+    start = 0
+    for index in range(shards):
+        end = start + size + (1 if index < extra else 0)
+        ranges.append(ordered[start:end])
+        start = end
+    return [shard for shard in ranges if shard]
+
+
+def _init_worker(stop):
+    global _stop
+    _stop = stop
+
+
+def _running():
+    return _stop is None or not _stop.is_set()
+
+
+def _wait(seconds):
+    # False when the shard was stopped during the wait
+    if _stop is None:
+        time.sleep(seconds)
+        return True
+    return not _stop.wait(seconds)
+
+
+def _fetch_lifetime(pacer, post_ids, metrics):
+    # A request that fails after the pacer's retries fails its posts
+    try:
+        return pacer.call(pacer.client.fetch_post_metrics, post_ids, metrics, cost=len(post_ids))
+    except GraphAPIError as e:
+        return {post_id: e for post_id in post_ids}
+
+
+def sync_shard(task):
+    # Runs in a worker process; returns counts and the segment path for the merge. Each worker paces
+    # its share of --rate with its own usage headers; what it stored before an error is still merged.
+    from async_fetch import Pacer
+
+    start_time = time.time()
+    client = GraphAPIClient(task["access_token"], app_secret=task["app_secret"], base_url=task["base_url"],
+                            version=task["version"])
+    pacer = Pacer(client, task["rate"], wait=_wait)
+    directory = task["path"]
+    store = ColumnStore(os.path.join(directory, "columns"))
+    state = SyncState(os.path.join(directory, "sync.db"))
+    post_ids = [post_id for post_id, _ in task["posts"]]
+    failed = set()
+    synced = set()
+    points = 0
+    error = None
+    try:
+        store.add_posts(task["posts"])
+        metrics = task["metrics"]
+
+        for offset in range(0, len(post_ids), BATCH_LIMIT):
+            if not _running():
+                break
+            results = _fetch_lifetime(pacer, post_ids[offset:offset + BATCH_LIMIT], metrics)
+            now = int(time.time())
+            fetched = {}
+            for post_id, values in results.items():
+                if isinstance(values, GraphAPIError):
+                    failed.add(post_id)
+                else:
+                    fetched[post_id] = values
+            for metric in metrics:
+                store.append_many(lifetime(metric), [(post_id, now, values[metric])
+                                                     for post_id, values in fetched.items() if metric in values])
+            synced.update(fetched)
+
+        if task["history"]:
+            # Seeded with the main watermarks, so only newer datapoints are fetched
+            state.advance(task["watermarks"])
+            sync = IncrementalSync(client, state, store, metrics, pacer=pacer)
+            results = sync.sync_posts(post_ids, running=_running)
+            failed.update(post_id for post_id, value in results.items() if isinstance(value, GraphAPIError))
+            points = sync.points_fetched
+    except (GraphAPIError, OSError) as e:
+        # OSError includes the requests connection errors; the posts not synced yet count as failed
+        error = str(e)
+        logger.error(f"Shard {task['shard']} failed: {e}")
+        failed.update(post_id for post_id in post_ids if post_id not in synced)
+    finally:
+        state.close()
+        store.close()
+        client.close()
+    return {"shard": task["shard"], "path": directory, "posts": len(post_ids), "failed": len(failed),
+            "points": points, "requests": client.request_count, "seconds": time.time() - start_time,
+            "completed": _running() and not error, "error": error}
+
+
+class ShardedSync:
+    def __init__(self, client, path, metrics, shards=None, shard_by="date", history=True, full=False, rate=20.0):
+        self.client = client
+        self.path = path
+        self.metrics = metrics
+        self.shards = shards or os.cpu_count() or 1
+        self.shard_by = shard_by
+        self.history = history
+        # full: ignore the stored watermarks and fetch the whole history again
+        self.full = full
+        # Calls per second for the whole sync, split evenly across the shards
+        self.rate = rate
+
+    def tasks(self, posts, state):
+        marks = [] if self.full else state.rows()
+        tasks = []
+        shards = split_posts(posts, self.shards, self.shard_by)
+        for index, shard in enumerate(shards):
+            ids = {post_id for post_id, _ in shard}
+            tasks.append({"shard": index, "path": os.path.join(self.path, f"shard-{index:03d}"), "posts": shard,
+                          "watermarks": [mark for mark in marks if mark[0] in ids], "metrics": self.metrics,
+                          "history": self.history, "access_token": self.client.access_token,
+                          "app_secret": self.client.app_secret, "base_url": self.client.base_url,
+                          "version": self.client.version, "rate": self.rate / len(shards)})
+        return tasks
+
+    def run(self, posts, state, control=None):
+        # Yields each shard's result as its worker finishes; after a cancel, the partial shards
+        # still come back so that what they fetched can be merged
+        control = control or JobControl()
+        if os.path.exists(self.path):
+            shutil.rmtree(self.path)  # segments of an interrupted run were never merged
+        tasks = self.tasks(posts, state)
+        if not tasks:
+            return
+        # spawn: forking a process that runs Tk or other threads is unsafe
+        context = multiprocessing.get_context("spawn")
+        stop = context.Event()
+        control.on_cancel(stop.set)
+        with ProcessPoolExecutor(max_workers=len(tasks), mp_context=context, initializer=_init_worker,
+                                 initargs=(stop,)) as pool:
+            futures = {pool.submit(sync_shard, task): task for task in tasks}
+            for future in as_completed(futures):
+                try:
+                    result = future.result()
+                except Exception as e:
+                    # A worker that died (or raised something unexpected) fails its whole shard;
+                    # its segment still holds what it stored and is merged like the others
+                    task = futures[future]
+                    logger.error(f"Shard {task['shard']} failed: {e!r}")
+                    result = {"shard": task["shard"], "path": task["path"], "posts": len(task["posts"]),
+                              "failed": len(task["posts"]), "points": 0, "requests": 0, "seconds": 0.0,
+                              "completed": False, "error": repr(e)}
+                yield result
+        if os.path.isdir(self.path) and not os.listdir(self.path):
+            os.rmdir(self.path)
+
+    def merge(self, result, store, state):
+        # Data first, then watermarks, as in the unsharded sync; the segment is removed afterwards
+        segment = ColumnStore(os.path.join(result["path"], "columns"))
+        try:
+            rows = store.merge(segment)
+        finally:
+            segment.close()
+        segment_state = SyncState(os.path.join(result["path"], "sync.db"))
+        try:
+            state.advance(segment_state.rows())
+        finally:
+            segment_state.close()
+        shutil.rmtree(result["path"])
+        return rows
@@ -0,0 +1,23 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from graph_stub import STUB_TOKEN, GraphStub  # noqa: E402
+
+
+@pytest.fixture(scope="module")
+def stub():
+    with GraphStub(posts=20, history_days=10) as server:
+        yield server
+
+
+@pytest.fixture
+def client(stub):
+    from graph_api import GraphAPIClient
+
+    client = GraphAPIClient(STUB_TOKEN, base_url=stub.url)
+    yield client
+    client.close()
@@ -0,0 +1,68 @@
+import time
+
+from async_fetch import AsyncPageFetcher, TokenBucket, backoff_delay
+from graph_api import GraphAPIClient, GraphAPIError
+from graph_stub import STUB_TOKEN, GraphStub
+from job_control import JobControl
+
+METRICS = ["engagement", "reach"]
+
+
+def test_token_bucket_waits_slows_down_and_pauses():
+    bucket = TokenBucket(10, capacity=2)
+    assert bucket.take() == bucket.take() == 0
+    assert 0.05 < bucket.take() <= 0.1
+    bucket.adjust(90)
+    assert bucket.rate == 1
+    bucket.adjust(100)
+    assert bucket.rate == bucket.min_rate == 0.5
+    bucket.pause(5)
+    assert bucket.take() > 4.9
+    assert bucket.waited > 5
+
+
+def test_backoff_delay_is_capped():
+    assert all(0 <= backoff_delay(attempt, base=1, cap=8) <= min(8, 2 ** attempt) for attempt in range(10))
+
+
+def test_fetches_every_post(client, stub):
+    fetcher = AsyncPageFetcher(client, concurrency=4, rate=1000)
+    results = fetcher.run("1000", METRICS, chunk_size=7)
+    assert len(results) == fetcher.listed == 20
+    assert all(set(values) == set(METRICS) for values in results.values())
+
+
+def test_resume_skips_completed_posts(client, stub):
+    chunks = []
+    fetcher = AsyncPageFetcher(client, rate=1000)
+    fetcher.run("1000", METRICS, on_chunk=lambda results, cursor: chunks.append(set(results)),
+                skip={"1000_1", "1000_2"}, chunk_size=5)
+    assert fetcher.skipped == 2
+    assert set().union(*chunks) == {f"1000_{index}" for index in range(3, 21)}
+
+
+def test_throttled_batches_are_retried():
+    with GraphStub(posts=30, call_limit=20, window=0.5) as stub:
+        client = GraphAPIClient(STUB_TOKEN, base_url=stub.url)
+        fetcher = AsyncPageFetcher(client, concurrency=3, rate=1000, backoff_base=0.2)
+        results = fetcher.run("1000", METRICS, chunk_size=10)
+        client.close()
+    assert fetcher.throttle_events > 0
+    assert len(results) == 30 and not any(isinstance(values, GraphAPIError) for values in results.values())
+
+
+def test_cancel_returns_partial_results():
+    with GraphStub(posts=30, latency=0.2) as stub:
+        client = GraphAPIClient(STUB_TOKEN, base_url=stub.url)
+        control = JobControl()
+        fetcher = AsyncPageFetcher(client, concurrency=1, rate=1000, control=control)
+        seen = []
+
+        def on_chunk(results, cursor):
+            seen.append(len(results))
+            control.cancel()
+        start = time.monotonic()
+        results = fetcher.run("1000", METRICS, on_chunk=on_chunk, chunk_size=5)
+        client.close()
+    assert seen and len(results) < 30
+    assert time.monotonic() - start < 2
@@ -0,0 +1,73 @@
+import json
+import signal
+import time
+from pathlib import Path
+
+import pytest
+
+from analytics_engine import main
+from graph_stub import STUB_TOKEN, GraphStub
+from job_control import Checkpoint
+
+
+@pytest.fixture(autouse=True)
+def no_signal_handlers(monkeypatch):
+    monkeypatch.setattr(signal, "signal", lambda signum, handler: None)
+
+
+def cli(stub_url, data_dir, *args, token=STUB_TOKEN, options=()):
+    # options: global flags, which go before the command
+    return main(["--data-dir", str(data_dir), "--graph-url", stub_url, "--app-id", "1", "--access-token", token,
+                 "--page-id", "1000", *options, *args])
+
+
+def test_report_runs_offline(tmp_path, stub, capsys):
+    assert cli(stub.url, tmp_path, "sync") == 0
+    capsys.readouterr()
+    assert cli("http://127.0.0.1:9", tmp_path, "report") == 0
+    assert "Top Performing Content" in capsys.readouterr().out
+    assert cli(stub.url, tmp_path, "report", token="expired") == 0
+
+
+def test_throttled_analyze_exits_with_error(tmp_path, capsys):
+    # The connect check uses the only call of the window
+    with GraphStub(posts=5, call_limit=1) as stub:
+        assert cli(stub.url, tmp_path, "analyze", "1000_1", "1000_2") == 1
+    assert "Error: (#4) Application request limit reached" in capsys.readouterr().err
+
+
+def test_connection_error_mid_job_exits_with_error(tmp_path, stub, monkeypatch, capsys):
+    import requests
+
+    from graph_api import GraphAPIClient
+
+    def reset(self, post_ids, metrics):
+        raise requests.ConnectionError("Connection reset by peer")
+    monkeypatch.setattr(GraphAPIClient, "fetch_post_metrics", reset)
+    assert cli(stub.url, tmp_path, "analyze", "1000_1", options=["--no-cache"]) == 1
+    assert "Error: Connection reset by peer" in capsys.readouterr().err
+
+
+def test_throttled_history_sync_is_retried(tmp_path, capsys):
+    # The lifetime batch fits in the window, the history batch after it is throttled until the window rolls
+    with GraphStub(posts=30, history_days=10, call_limit=40, window=1.0) as stub:
+        assert cli(stub.url, tmp_path, "sync", "--history", "--rate", "1000", options=["--no-cache"]) == 0
+    assert "History: 1200 datapoints for 30 posts" in capsys.readouterr().out
+
+
+def test_sync_resumes_checkpoint_within_max_age(tmp_path, stub, capsys):
+    # Older than every cache TTL, but within the default checkpoint_max_age
+    checkpoint = Checkpoint(str(tmp_path), "sync", "1000")
+    checkpoint.mark(["1000_1", "1000_2"])
+    state = json.loads(Path(checkpoint.path).read_text())
+    state["updated"] = time.time() - 2 * 3600
+    Path(checkpoint.path).write_text(json.dumps(state))
+
+    (tmp_path / "config.json").write_text(json.dumps({"checkpoint_max_age": 1}))
+    assert cli(stub.url, tmp_path, "sync", options=["--no-cache"]) == 0
+    assert "Resuming" not in capsys.readouterr().out
+
+    Path(checkpoint.path).write_text(json.dumps(state))
+    (tmp_path / "config.json").unlink()
+    assert cli(stub.url, tmp_path, "sync", options=["--no-cache"]) == 0
+    assert "Resuming: 2 posts already synced" in capsys.readouterr().out
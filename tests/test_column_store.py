@@ -0,0 +1,19 @@
+import numpy as np
+
+from column_store import ColumnStore
+
+
+def test_iter_chunks_streams_deduplicated_column(tmp_path):
+    store = ColumnStore(str(tmp_path / "columns"))
+    rng = np.random.default_rng(7)
+    for _ in range(5):
+        store.append_many("reach", [(f"1000_{post}", int(day) * 86400, float(value)) for post, day, value
+                                    in zip(rng.integers(0, 40, 300), rng.integers(0, 30, 300), rng.random(300))])
+    column = store.column("reach")
+
+    for block_rows in (1, 97, 1 << 20):
+        chunks = list(store.iter_chunks("reach", chunk_size=50, block_rows=block_rows))
+        assert all(len(values) <= 50 for _, _, values in chunks)
+        for streamed, stored in zip(map(np.concatenate, zip(*chunks)), (column.post, column.time, column.value)):
+            np.testing.assert_array_equal(streamed, stored)
+    store.close()
@@ -0,0 +1,89 @@
+import pytest
+
+from graph_api import NOT_MODIFIED, GraphAPIClient, GraphAPIError, post_fields, post_id_from_url
+from graph_stub import GraphStub
+
+METRICS = ["engagement", "reach", "impressions", "clicks", "shares", "comments", "reactions"]
+
+
+def expected_metrics(stub, post_id):
+    _, body = stub.post(post_id, post_fields(METRICS))
+    lifetime = {item["name"]: item["values"][0]["value"] for item in body["insights"]["data"]}
+    return {"engagement": lifetime["post_engaged_users"], "reach": lifetime["post_impressions_unique"],
+            "impressions": lifetime["post_impressions"], "clicks": lifetime["post_clicks"],
+            "shares": body["shares"]["count"], "comments": body["comments"]["summary"]["total_count"],
+            "reactions": body["reactions"]["summary"]["total_count"]}
+
+
+def test_single_request_metrics(stub, client):
+    assert client.post_metrics("1000_1", METRICS) == expected_metrics(stub, "1000_1")
+    assert client.request_count == 1
+
+
+def test_batch_metrics_match_single_requests(stub, client):
+    post_ids = [f"1000_{index}" for index in range(1, 8)]
+    results = client.fetch_post_metrics(post_ids, METRICS)
+    assert client.request_count == 1
+    assert results == {post_id: expected_metrics(stub, post_id) for post_id in post_ids}
+
+
+@pytest.mark.parametrize("url, expected", [
+    ("1000_5", "1000_5"),
+    ("123456", "123456"),
+    ("https://www.facebook.com/page/posts/987", "1000_987"),
+    ("https://www.facebook.com/page/videos/55", "1000_55"),
+    ("https://www.facebook.com/permalink.php?story_fbid=42&id=777", "777_42"),
+    ("https://www.facebook.com/permalink.php?story_fbid=42", "1000_42"),
+    ("https://www.facebook.com/photo.php?fbid=31", "31"),
+])
+def test_post_id_from_url(url, expected):
+    assert post_id_from_url(url, "1000") == expected
+
+
+def test_post_id_from_url_rejects_other_urls():
+    with pytest.raises(ValueError):
+        post_id_from_url("https://www.facebook.com/page/about", "1000")
+
+
+def test_invalid_token_error(stub):
+    client = GraphAPIClient("wrong-token", base_url=stub.url)
+    with pytest.raises(GraphAPIError) as error:
+        client.validate("1000")
+    assert error.value.code == 190
+    assert error.value.status == 401
+    assert not error.value.throttled
+
+
+def test_batch_item_errors_are_per_post(client):
+    results = client.fetch_post_metrics(["1000_1", "1000_999"], METRICS)
+    assert isinstance(results["1000_999"], GraphAPIError)
+    assert results["1000_999"].code == 100
+    assert results["1000_1"]["shares"] >= 0
+
+
+def test_throttle_decoding():
+    from graph_stub import STUB_TOKEN
+
+    with GraphStub(posts=5, call_limit=2) as stub:
+        client = GraphAPIClient(STUB_TOKEN, base_url=stub.url)
+        client.post_metrics("1000_1", METRICS)
+        assert client.usage_percent() == 50
+        client.post_metrics("1000_2", METRICS)
+        with pytest.raises(GraphAPIError) as error:
+            client.post_metrics("1000_3", METRICS)
+        assert error.value.throttled
+        assert error.value.code == 4
+        assert client.usage_percent() == 100
+        client.close()
+
+
+def test_batch_etag_not_modified(client):
+    post_ids = ["1000_1", "1000_2", "1000_3"]
+    first = client.batch_post_metrics(post_ids, METRICS)
+    etags = {post_id: etag for post_id, (_, etag) in first.items()}
+    assert all(etags.values())
+
+    second = client.batch_post_metrics(post_ids, METRICS, etags={"1000_1": etags["1000_1"], "1000_2": '"stale"'})
+    assert second["1000_1"] == (NOT_MODIFIED, etags["1000_1"])
+    assert second["1000_2"] == first["1000_2"]
+    assert second["1000_3"] == first["1000_3"]
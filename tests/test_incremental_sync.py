@@ -0,0 +1,41 @@
+from async_fetch import Pacer
+from column_store import ColumnStore
+from graph_api import GraphAPIClient, GraphAPIError
+from graph_stub import STUB_TOKEN, GraphStub
+from incremental_sync import IncrementalSync, SyncState
+
+METRICS = ["engagement", "reach"]
+
+
+def open_sync(client, tmp_path, pacer=None):
+    state = SyncState(str(tmp_path / "sync.db"))
+    store = ColumnStore(str(tmp_path / "columns"))
+    return IncrementalSync(client, state, store, METRICS, pacer=pacer), state, store
+
+
+def test_second_sync_starts_at_watermarks(client, tmp_path):
+    sync, state, store = open_sync(client, tmp_path)
+    results = sync.sync_posts(["1000_1", "1000_2"])
+    assert all(count > 0 for count in results.values())
+    assert set(state.watermarks("1000_1")) == set(METRICS)
+    first = sync.points_fetched
+
+    again = IncrementalSync(client, state, store, METRICS)
+    again.sync_posts(["1000_1", "1000_2"])
+    assert again.points_fetched < first
+    state.close()
+    store.close()
+
+
+def test_throttled_chunk_fails_its_posts(tmp_path):
+    with GraphStub(posts=3, call_limit=1) as stub:
+        client = GraphAPIClient(STUB_TOKEN, base_url=stub.url)
+        pacer = Pacer(client, rate=1000, max_retries=1, backoff_base=0.01)
+        sync, state, store = open_sync(client, tmp_path, pacer)
+        results = sync.sync_posts(["1000_1", "1000_2", "1000_3"])
+        client.close()
+    assert all(isinstance(error, GraphAPIError) and error.throttled for error in results.values())
+    assert pacer.throttle_events == 1
+    assert state.rows() == []
+    state.close()
+    store.close()
@@ -0,0 +1,38 @@
+import json
+import threading
+import time
+
+from job_control import Checkpoint, JobControl
+
+
+def test_checkpoint_resumes_same_key(tmp_path):
+    checkpoint = Checkpoint(str(tmp_path), "sync", "1000", max_age=900)
+    checkpoint.mark(["1000_1", "1000_2"], cursor="abc")
+
+    resumed = Checkpoint(str(tmp_path), "sync", "1000", max_age=900)
+    assert resumed.resumed
+    assert resumed.completed == {"1000_1", "1000_2"}
+    assert resumed.cursor == "abc"
+    assert not Checkpoint(str(tmp_path), "sync", "2000").resumed
+
+
+def test_checkpoint_older_than_max_age_is_ignored(tmp_path):
+    checkpoint = Checkpoint(str(tmp_path), "sync", "1000")
+    checkpoint.mark(["1000_1"], cursor="abc")
+    with open(checkpoint.path) as f:
+        state = json.load(f)
+    state["updated"] = time.time() - 1000
+    with open(checkpoint.path, 'w') as f:
+        json.dump(state, f)
+
+    assert not Checkpoint(str(tmp_path), "sync", "1000", max_age=900).resumed
+    assert Checkpoint(str(tmp_path), "sync", "1000", max_age=1200).resumed
+    assert Checkpoint(str(tmp_path), "sync", "1000").resumed
+
+
+def test_wait_returns_on_cancel():
+    control = JobControl()
+    assert not control.wait(0.01)
+    threading.Timer(0.05, control.cancel).start()
+    assert control.wait(5)
+    assert not control()
@@ -0,0 +1,48 @@
+import time
+
+from metrics_cache import MetricsCache
+
+METRICS = ["engagement", "shares"]
+
+
+def test_fresh_values_follow_ttl(tmp_path):
+    cache = MetricsCache(str(tmp_path / "cache.db"), ttl={"shares": 0})
+    cache.put("1000_1", {"engagement": 5, "shares": 2})
+    assert cache.fresh_values(["1000_1"], ["engagement"]) == {"1000_1": {"engagement": 5}}
+    assert cache.fresh_values(["1000_1"], METRICS) == {}
+    cache.close()
+
+
+def test_stale_metrics_are_revalidated_with_etag(tmp_path, client):
+    cache = MetricsCache(str(tmp_path / "cache.db"), ttl={metric: 0 for metric in METRICS})
+    first = cache.fetch_post_metrics(client, ["1000_1", "1000_2"], METRICS)
+    requests = client.request_count
+    assert cache.misses == 2 and cache.revalidated == 0
+
+    # Expired at once, but unchanged on the server: 304s refresh the TTL without a body
+    again = cache.fetch_post_metrics(client, ["1000_1", "1000_2"], METRICS)
+    assert again == first
+    assert cache.revalidated == 2 and client.request_count == requests + 1
+
+    cache.ttl = {metric: 900 for metric in METRICS}
+    cache.touch("1000_1", METRICS)
+    assert cache.fetch_post_metrics(client, ["1000_1"], METRICS) == {"1000_1": first["1000_1"]}
+    assert cache.hits == 1 and client.request_count == requests + 1
+    cache.close()
+
+
+def test_least_recently_used_rows_are_evicted(tmp_path):
+    cache = MetricsCache(str(tmp_path / "cache.db"), max_bytes=1000)
+    for index in range(10):
+        cache.put(f"1000_{index}", {"engagement": index})
+        time.sleep(0.001)
+    cache.lookup("1000_0", ["engagement"])
+    for index in range(10, 20):
+        cache.put(f"1000_{index}", {"engagement": index})
+        time.sleep(0.001)
+
+    assert cache.size <= 1000
+    assert cache.lookup("1000_0", ["engagement"])
+    assert not cache.lookup("1000_1", ["engagement"])
+    assert cache.lookup("1000_19", ["engagement"])
+    cache.close()
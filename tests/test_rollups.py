@@ -0,0 +1,83 @@
+import numpy as np
+import pytest
+
+from analytics_engine import AnalyticsEngine
+from column_store import DAY, ColumnStore
+from graph_stub import STUB_TOKEN
+from rollups import POSTING_GRAINS, TIME_GRAINS, Rollups
+from webhooks import WebhookIngest
+
+
+def quiet(line):
+    pass
+
+
+@pytest.fixture
+def engine(stub, tmp_path):
+    engine = AnalyticsEngine(str(tmp_path), use_cache=False)
+    engine.config["graph_url"] = stub.url
+    engine.connect("1", STUB_TOKEN, "1000")
+    yield engine
+    engine.rollups.close()
+    engine.store.close()
+
+
+def assert_matches_rebuild(store, rollups, tmp_path):
+    rebuilt = Rollups(str(tmp_path / "rebuilt.db"))
+    try:
+        for metric in store.metrics():
+            rebuilt.rebuild(store, metric)
+            for grain in TIME_GRAINS:
+                keys, totals = rollups.buckets(metric, grain)
+                expected_keys, expected_totals = rebuilt.buckets(metric, grain)
+                np.testing.assert_array_equal(keys[totals != 0], expected_keys[expected_totals != 0])
+                np.testing.assert_allclose(totals[totals != 0], expected_totals[expected_totals != 0])
+            for grain in POSTING_GRAINS:
+                np.testing.assert_allclose(rollups.slots(metric, grain), rebuilt.slots(metric, grain), atol=1e-6)
+            assert rollups.top(metric) == rebuilt.top(metric), metric
+            post_ids = list(store.post_ids)
+            assert rollups.latest(metric, post_ids) == rebuilt.latest(metric, post_ids), metric
+    finally:
+        rebuilt.close()
+
+
+def test_incremental_rollups_match_rebuild(engine, tmp_path):
+    # Analyzed first, so these posts' totals are folded before their posting times are known
+    assert engine.analyze_posts(["1000_1", "1000_2", "1000_3"], log=quiet)
+    assert engine.sync_page(log=quiet, history=True, restart=True)
+    assert engine.sync_page(log=quiet, history=True, restart=True)
+
+    ingest = WebhookIngest(engine.store, "1000", "secret")
+    ingest.apply({"object": "page", "entry": [{"id": "1000", "changes": [
+        {"field": "feed", "value": {"item": "comment", "verb": "add", "post_id": "1000_1"}},
+        {"field": "feed", "value": {"item": "reaction", "verb": "add", "post_id": "1000_2"}},
+        {"field": "feed", "value": {"item": "share", "verb": "remove", "post_id": "1000_3"}},
+        {"field": "feed", "value": {"item": "status", "verb": "add", "post_id": "1000_99",
+                                    "created_time": 1700000000}},
+        {"field": "feed", "value": {"item": "comment", "verb": "add", "post_id": "1000_99"}}]}]})
+
+    assert engine.rollups.refresh(engine.store) == []
+    assert_matches_rebuild(engine.store, engine.rollups, tmp_path)
+
+
+def test_posting_time_set_without_new_rows(engine, tmp_path):
+    assert engine.analyze_posts(["1000_4"], log=quiet)
+    engine.store.add_posts([("1000_4", 1700000000)])
+
+    assert "engagement.lifetime" in engine.rollups.refresh(engine.store)
+    assert_matches_rebuild(engine.store, engine.rollups, tmp_path)
+
+
+def test_rewritten_older_point_is_folded(tmp_path):
+    store = ColumnStore(str(tmp_path / "columns"))
+    rollups = Rollups(str(tmp_path / "rollups.db"))
+    rollups.attach(store)
+    store.append_many("reach", [("1000_1", 10 * DAY, 5.0), ("1000_1", 11 * DAY, 7.0), ("1000_1", 12 * DAY, 9.0)])
+    # A revised day older than the post's newest point, next to one that was never stored
+    store.append_many("reach", [("1000_1", 10 * DAY, 50.0), ("1000_1", 9 * DAY, 3.0), ("1000_1", 12 * DAY, 9.0)])
+
+    assert rollups.buckets("reach", "day")[1].sum() == store.column("reach").value.sum() == 69
+    assert rollups.refresh(store) == []
+    assert_matches_rebuild(store, rollups, tmp_path)
+    rollups.close()
+    store.close()
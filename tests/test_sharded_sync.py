@@ -0,0 +1,58 @@
+import signal
+
+import pytest
+
+from analytics_engine import main
+from column_store import ColumnStore, lifetime
+from graph_api import GRAPH_VERSION
+from graph_stub import STUB_TOKEN, GraphStub
+from sharded_sync import split_posts, sync_shard
+
+
+@pytest.fixture(autouse=True)
+def no_signal_handlers(monkeypatch):
+    monkeypatch.setattr(signal, "signal", lambda signum, handler: None)
+
+
+def sync(stub_url, data_dir, *args):
+    return main(["--data-dir", str(data_dir), "--graph-url", stub_url, "--app-id", "1", "--access-token", STUB_TOKEN,
+                 "--page-id", "1000", "sync", *args])
+
+
+def test_split_posts_by_date_and_id():
+    posts = [("1000_10", 300), ("1000_9", 100), ("1000_2", 200), ("1000_1", 400), ("1000_3", 0)]
+    assert split_posts(posts, 2) == [[("1000_3", 0), ("1000_9", 100), ("1000_2", 200)],
+                                     [("1000_10", 300), ("1000_1", 400)]]
+    assert [[post_id for post_id, _ in shard] for shard in split_posts(posts, 2, by="id")] == \
+        [["1000_1", "1000_2", "1000_3"], ["1000_9", "1000_10"]]
+    assert len(split_posts(posts[:2], 8)) == 2
+
+
+def test_throttled_shards_are_retried(tmp_path, capsys):
+    # Both workers share the stub's call window, so their batches are throttled until it rolls
+    with GraphStub(posts=30, history_days=10, call_limit=40, window=1.0) as stub:
+        assert sync(stub.url, tmp_path, "--shards", "2", "--history", "--rate", "1000") == 0
+    out = capsys.readouterr().out
+    assert "Synced 30 posts and 1200 datapoints" in out
+    store = ColumnStore(str(tmp_path / "columns"))
+    assert len(set(store.column(lifetime("engagement")).post)) == 30
+    store.close()
+    assert not (tmp_path / "shards").exists()
+
+
+def test_failed_shard_returns_partial_result(tmp_path):
+    posts = [("1000_1", 100), ("1000_2", 200)]
+    result = sync_shard({"shard": 0, "path": str(tmp_path / "shard-000"), "posts": posts, "watermarks": [],
+                         "metrics": ["engagement"], "history": True, "access_token": STUB_TOKEN,
+                         "app_secret": None, "base_url": "http://127.0.0.1:9", "version": GRAPH_VERSION, "rate": 1000})
+    assert result["failed"] == 2 and result["error"] and not result["completed"]
+    segment = ColumnStore(str(tmp_path / "shard-000" / "columns"))
+    assert sorted(segment.post_ids) == ["1000_1", "1000_2"]
+    segment.close()
+
+
+@pytest.mark.parametrize("option", [["--restart"], ["--concurrency", "4"], ["--export", "out.csv"]])
+def test_unsupported_sharded_options_are_rejected(tmp_path, option):
+    with pytest.raises(SystemExit) as error:
+        sync("http://127.0.0.1:9", tmp_path, "--shards", "2", *option)
+    assert error.value.code == 2
@@ -0,0 +1,154 @@
+import json
+import signal
+import time
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+
+import pytest
+
+from analytics_engine import main
+from column_store import ColumnStore, lifetime
+from rollups import Rollups
+from webhooks import SIGNATURE_HEADER, WebhookError, WebhookIngest, WebhookServer, sign
+
+SECRET = "app-secret"
+PAGE_ID = "1000"
+
+
+def feed_payload(*changes, page_id=PAGE_ID):
+    return {"object": "page", "entry": [{"id": page_id, "time": 0, "changes": [
+        {"field": "feed", "value": dict(value, post_id=value.get("post_id", f"{PAGE_ID}_1"))} for value in changes]}]}
+
+
+def body_of(payload):
+    return json.dumps(payload).encode("utf-8")
+
+
+def stored(store, metric, post_id):
+    column = store.column(lifetime(metric))
+    code = store.codes[post_id]
+    return column.value[column.post == code][-1]
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = ColumnStore(str(tmp_path / "columns"))
+    store.add_posts([(f"{PAGE_ID}_1", 1700000000)])
+    store.append_many(lifetime("comments"), [(f"{PAGE_ID}_1", 1700000000, 5.0)])
+    yield store
+    store.close()
+
+
+@pytest.fixture
+def server(store):
+    ingest = WebhookIngest(store, PAGE_ID, SECRET)
+    server = WebhookServer(ingest, "verify-me", port=0).start()
+    yield server
+    server.stop()
+
+
+def post(server, body, signature):
+    request = Request(server.url, data=body, headers={SIGNATURE_HEADER: signature} if signature else {})
+    with urlopen(request) as response:
+        return json.loads(response.read())
+
+
+def test_signed_event_updates_counter(store, server):
+    body = body_of(feed_payload({"item": "comment", "verb": "add"}, {"item": "comment", "verb": "add"},
+                                {"item": "reaction", "verb": "add"}))
+    assert post(server, body, sign(SECRET, body)) == {"applied": 3}
+    assert stored(store, "comments", f"{PAGE_ID}_1") == 7
+    assert stored(store, "reactions", f"{PAGE_ID}_1") == 1
+
+
+@pytest.mark.parametrize("signature", [None, "sha256=0000", sign("other-secret", b"{}")])
+def test_bad_signature_is_rejected(store, server, signature):
+    body = body_of(feed_payload({"item": "comment", "verb": "add"}))
+    with pytest.raises(HTTPError) as error:
+        post(server, body, signature)
+    assert error.value.code == 403
+    assert stored(store, "comments", f"{PAGE_ID}_1") == 5
+
+
+def test_other_pages_are_ignored(store):
+    ingest = WebhookIngest(store, PAGE_ID, SECRET)
+    body = body_of(feed_payload({"item": "comment", "verb": "add"}, page_id="2000"))
+    assert ingest.handle(body, sign(SECRET, body)) == 0
+
+
+def test_subscription_handshake(server):
+    query = "hub.mode=subscribe&hub.verify_token=verify-me&hub.challenge=1158201444"
+    with urlopen(f"{server.url}/?{query}") as response:
+        assert response.read() == b"1158201444"
+    with pytest.raises(HTTPError) as error:
+        urlopen(f"{server.url}/?hub.mode=subscribe&hub.verify_token=wrong&hub.challenge=1")
+    assert error.value.code == 403
+
+
+def test_record_and_replay(tmp_path, store):
+    path = tmp_path / "webhooks.jsonl"
+    with open(path, 'w', encoding='utf-8') as record:
+        ingest = WebhookIngest(store, PAGE_ID, SECRET, record)
+        for value in ({"item": "post", "verb": "add", "post_id": f"{PAGE_ID}_2", "created_time": 1700003600},
+                      {"item": "comment", "verb": "add", "post_id": f"{PAGE_ID}_2"}):
+            body = body_of(feed_payload(value))
+            ingest.handle(body, sign(SECRET, body))
+    assert stored(store, "comments", f"{PAGE_ID}_2") == 1
+
+    replay_store = ColumnStore(str(tmp_path / "replayed"))
+    assert WebhookIngest(replay_store, PAGE_ID, SECRET).replay(str(path)) == 2
+    assert replay_store.created[replay_store.codes[f"{PAGE_ID}_2"]] == 1700003600
+    assert stored(replay_store, "comments", f"{PAGE_ID}_2") == 1
+    with pytest.raises(WebhookError):
+        WebhookIngest(replay_store, PAGE_ID, "other-secret").replay(str(path))
+    replay_store.close()
+
+
+def test_counter_reads_writes_from_other_stores(tmp_path, store):
+    # A sync in another process writes the same column between two webhook deliveries
+    ingest = WebhookIngest(store, PAGE_ID, SECRET)
+    ingest.apply(feed_payload({"item": "comment", "verb": "add"}))
+    other = ColumnStore(store.path)
+    now = int(time.time())
+    other.append_many(lifetime("comments"), [(f"{PAGE_ID}_1", now, 40.0), (f"{PAGE_ID}_3", now, 2.0)])
+    other.close()
+    ingest.apply(feed_payload({"item": "comment", "verb": "add"}, {"item": "comment", "verb": "remove",
+                                                                    "post_id": f"{PAGE_ID}_3"}))
+    assert stored(store, "comments", f"{PAGE_ID}_1") == 41
+    assert stored(store, "comments", f"{PAGE_ID}_3") == 1
+    assert len(store.post_ids) == len(set(store.post_ids)) == 2
+
+
+def test_cli_replays_unsigned_payload(tmp_path, monkeypatch):
+    monkeypatch.setattr(signal, "signal", lambda signum, handler: None)
+    path = tmp_path / "payload.json"
+    path.write_text(json.dumps(feed_payload({"item": "share", "verb": "add"})))
+    data_dir = str(tmp_path / "data")
+    args = ["--data-dir", data_dir, "--page-id", PAGE_ID, "webhook", "--replay", str(path), "--app-secret", SECRET]
+
+    assert main(args) == 1
+    assert main(args + ["--unsigned"]) == 0
+    store = ColumnStore(str(tmp_path / "data" / "columns"))
+    assert stored(store, "shares", f"{PAGE_ID}_1") == 1
+    store.close()
+
+
+def test_counter_reads_rollups_and_falls_back_to_column(tmp_path, store, monkeypatch):
+    rollups = Rollups(str(tmp_path / "rollups.db"))
+    rollups.attach(store)
+    rollups.refresh(store)
+    ingest = WebhookIngest(store, PAGE_ID, SECRET, rollups=rollups)
+    column_reads = []
+    read_column = store.column
+    monkeypatch.setattr(store, "column", lambda metric: column_reads.append(metric) or read_column(metric))
+
+    ingest.apply(feed_payload({"item": "comment", "verb": "add"}))
+    assert column_reads == []
+    # Written by a store without the rollups listener, so the latest table is behind
+    other = ColumnStore(store.path)
+    other.append_many(lifetime("comments"), [(f"{PAGE_ID}_1", int(time.time()), 40.0)])
+    other.close()
+    ingest.apply(feed_payload({"item": "comment", "verb": "add"}))
+    assert column_reads == [lifetime("comments")]
+    assert stored(store, "comments", f"{PAGE_ID}_1") == 41
+    rollups.close()
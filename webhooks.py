@@ -0,0 +1,219 @@
+import hashlib
+import hmac
+import json
+import logging
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import numpy as np
+
+import instrumentation
+from column_store import lifetime
+from graph_api import parse_time
+
+# Page webhooks: signed feed events are applied to the stored lifetime counters as they arrive,
+# so the report stays current between syncs without polling the Graph API
+logger = logging.getLogger("PPR")
+
+SIGNATURE_HEADER = "X-Hub-Signature-256"
+
+# Webhook item -> counter it moves; posts and other items only register the post
+COUNTERS = {"comment": "comments", "reaction": "reactions", "share": "shares"}
+VERBS = {"add": 1, "remove": -1}
+POST_ITEMS = {"post", "status", "photo", "video", "link"}
+
+
+class WebhookError(ValueError):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def sign(app_secret, body):
+    return "sha256=" + hmac.new(app_secret.encode(), body, hashlib.sha256).hexdigest()
+
+
+def verify_signature(app_secret, body, signature):
+    # signature: the X-Hub-Signature-256 header, "sha256=<hex digest of the raw body>"
+    if not app_secret:
+        raise WebhookError("app_secret is not configured, cannot verify webhook signatures", 403)
+    if not signature or not hmac.compare_digest(sign(app_secret, body), signature):
+        raise WebhookError("Invalid webhook signature", 403)
+
+
+def page_changes(payload, page_id):
+    # Yields (field, value) for every change to our page; other objects and pages are ignored
+    if payload.get("object") != "page":
+        return
+    for entry in payload.get("entry", []):
+        if str(entry.get("id")) != str(page_id):
+            logger.warning(f"Ignoring webhook entry for page {entry.get('id')}")
+            continue
+        for change in entry.get("changes", []):
+            yield change.get("field"), change.get("value", {})
+
+
+class WebhookIngest:
+    def __init__(self, store, page_id, app_secret, record=None, rollups=None):
+        self.store = store
+        # rollups: Rollups attached to the store; its latest table answers _current without a column read
+        self.rollups = rollups
+        self.page_id = page_id
+        self.app_secret = app_secret
+        # record: file object receiving every verified payload as a JSON line, for replay
+        self.record = record
+        self.events = 0
+        self._lock = threading.Lock()
+
+    def _current(self, metric, post_ids):
+        # {post_id: newest stored lifetime value}; read again every time, since syncs write the same column.
+        # The rollups have it per post as long as they folded every row, else the column is read.
+        name = lifetime(metric)
+        if self.rollups and self.rollups.folded_rows(name) == self.store.row_count(name):
+            return self.rollups.latest(name, post_ids)
+        column = self.store.column(name)
+        if not len(column):
+            return {}
+        codes = [self.store.codes.get(post_id, -1) for post_id in post_ids]
+        index = np.maximum(np.searchsorted(column.post, codes, side="right") - 1, 0)
+        return {post_id: float(column.value[i]) for post_id, code, i in zip(post_ids, codes, index.tolist())
+                if column.post[i] == code}
+
+    def handle(self, body, signature, verify=True):
+        # body: the raw request bytes; returns the number of events applied
+        if verify:
+            verify_signature(self.app_secret, body, signature)
+        try:
+            payload = json.loads(body)
+        except ValueError:
+            raise WebhookError("Webhook body is not JSON")
+        if self.record:
+            with self._lock:
+                self.record.write(json.dumps({"received": int(time.time()), "signature": signature,
+                                              "body": body.decode("utf-8")}) + "\n")
+                self.record.flush()
+        return self.apply(payload)
+
+    def apply(self, payload):
+        posts = []
+        deltas = {}
+        for field, value in page_changes(payload, self.page_id):
+            item = value.get("item", field)
+            post_id = value.get("post_id")
+            instrumentation.count("webhook_events", field=field, item=item)
+            if not post_id:
+                continue
+            created = value.get("created_time")
+            if isinstance(created, str):
+                created = parse_time(created)
+            if item in POST_ITEMS and value.get("verb") == "add":
+                posts.append((post_id, created or int(time.time())))
+            elif item in COUNTERS and value.get("verb") in VERBS:
+                key = (post_id, COUNTERS[item])
+                deltas[key] = deltas.get(key, 0) + VERBS[value["verb"]]
+
+        # The store lock spans reading and writing the counters, so a sync in another process cannot
+        # write in between
+        with self._lock, self.store.locked():
+            if posts:
+                self.store.add_posts(posts)
+            now = int(time.time())
+            by_metric = {}
+            for (post_id, metric), delta in deltas.items():
+                by_metric.setdefault(metric, {})[post_id] = delta
+            # Cumulative columns: the newest row per post wins, and the next sync overwrites the estimate
+            for metric, metric_deltas in by_metric.items():
+                current = self._current(metric, list(metric_deltas))
+                self.store.append_many(lifetime(metric), [(post_id, now, max(0, current.get(post_id, 0) + delta))
+                                                          for post_id, delta in metric_deltas.items()])
+            applied = len(posts) + sum(abs(delta) for delta in deltas.values())
+            self.events += applied
+        return applied
+
+    def replay(self, path, verify=True):
+        # Recorded JSON lines ({"signature", "body"}) are verified like live requests; a plain JSON
+        # payload file can only be applied unverified
+        applied = 0
+        with open(path, 'r', encoding='utf-8') as f:
+            text = f.read()
+        try:
+            records = [json.loads(line) for line in text.splitlines() if line.strip()]
+        except ValueError:
+            records = [json.loads(text)]
+        for record in records:
+            if "body" in record:
+                applied += self.handle(record["body"].encode("utf-8"), record.get("signature"), verify=verify)
+            elif verify:
+                raise WebhookError(f"{path} holds an unsigned payload, replay it without verification")
+            else:
+                applied += self.apply(record)
+        logger.info(f"Replayed {len(records)} webhook payloads from {path}: {applied} events applied")
+        return applied
+
+
+class WebhookHandler(BaseHTTPRequestHandler):
+    ingest = None
+    verify_token = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status, body, content_type="text/plain"):
+        body = body.encode()
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        # Subscription handshake: echo hub.challenge when the verify token matches
+        query = parse_qs(urlparse(self.path).query)
+        mode = query.get("hub.mode", [""])[0]
+        token = query.get("hub.verify_token", [""])[0]
+        if mode == "subscribe" and self.verify_token and hmac.compare_digest(token, self.verify_token):
+            logger.info("Webhook subscription verified")
+            self._send(200, query.get("hub.challenge", [""])[0])
+        else:
+            logger.warning("Rejected webhook verification request")
+            self._send(403, "Forbidden")
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        try:
+            applied = self.ingest.handle(body, self.headers.get(SIGNATURE_HEADER))
+        except WebhookError as e:
+            logger.warning(f"Rejected webhook: {e}")
+            self._send(e.status, str(e))
+            return
+        except Exception as e:
+            # Facebook retries failed deliveries, so an error here is not lost
+            logger.error(f"Webhook processing failed: {str(e)}")
+            self._send(500, "Error")
+            return
+        self._send(200, json.dumps({"applied": applied}), "application/json")
+
+
+class WebhookServer:
+    def __init__(self, ingest, verify_token, host="127.0.0.1", port=8080):
+        class Handler(WebhookHandler):
+            pass
+        Handler.ingest = ingest
+        Handler.verify_token = verify_token
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()